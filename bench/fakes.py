@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional
+import discord
+from cogs.cluster import Cluster
+
+_ids = itertools.count(10**17)
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel"):
+        self.id = next(_ids)
+        self.channel = channel
+
+    async def publish(self):
+        await self.channel.wait()
+
+class FakeChannel:
+    """Stands in for a guild TextChannel; send() takes `latency` like a Discord round trip."""
+
+    def __init__(self, guild: "FakeGuild", latency: float = 0.0, failure_rate: float = 0.0, rng: Optional[random.Random] = None):
+        self.id = next(_ids)
+        self.guild = guild
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random()
+        self.sent = 0
+
+    async def wait(self):
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, content: Optional[str] = None, embed: Optional[discord.Embed] = None, **kwargs):
+        await self.wait()
+        if self.rng.random() < self.failure_rate:
+            raise discord.DiscordServerError(FakeHTTPResponse(503), "stub failure")
+        self.sent += 1
+        return FakeMessage(self)
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        message = FakeMessage(self)
+        message.id = message_id
+        return message
+
+class FakeHTTPResponse:
+    # just enough of aiohttp.ClientResponse for discord.HTTPException
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "stub"
+
+class FakeRole:
+    def __init__(self, guild: "FakeGuild"):
+        self.id = next(_ids)
+        self.guild = guild
+        self.mention = f"<@&{self.id}>"
+
+class FakeGuild:
+    def __init__(self, channel_latency: float = 0.0, channel_failure_rate: float = 0.0, rng: Optional[random.Random] = None):
+        self.id = next(_ids)
+        self.name = f"guild-{self.id}"
+        self.unavailable = False
+        self.channel = FakeChannel(self, channel_latency, channel_failure_rate, rng)
+        self.role = FakeRole(self)
+        self._channels = {self.channel.id: self.channel}
+        self._roles = {self.role.id: self.role}
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self._channels.get(channel_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self._done = False
+        self.messages: List[Dict[str, Any]] = []
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, ephemeral: bool = False, thinking: bool = False):
+        self._done = True
+
+    async def send_message(self, content: Optional[str] = None, **kwargs):
+        self._done = True
+        self.messages.append({"content": content, **kwargs})
+        self.interaction.finish()
+
+    async def send_modal(self, modal):
+        self._done = True
+        self.interaction.finish()
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self.messages: List[Dict[str, Any]] = []
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        self.messages.append({"content": content, **kwargs})
+        self.interaction.finish()
+
+class FakeInteraction:
+    """
+    Enough of discord.Interaction for the cogs' command and component handlers.
+    `latency` is the time from construction (the bot receiving it) to the first reply.
+    """
+
+    def __init__(
+        self,
+        guild: Optional[FakeGuild] = None,
+        type: discord.InteractionType = discord.InteractionType.application_command,
+        data: Optional[Dict[str, Any]] = None,
+    ):
+        self.id = next(_ids)
+        self.type = type
+        self.guild = guild
+        self.guild_id = guild.id if guild else None
+        self.data = data or {}
+        self.command = None
+        self.user = None
+        self.extras: Dict[str, Any] = {"received_at": time.perf_counter()}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.latency: Optional[float] = None
+
+    def finish(self):
+        if self.latency is None:
+            self.latency = time.perf_counter() - self.extras["received_at"]
+
+class FakeBot:
+    """The parts of JBAppBot the cogs use: upstream client, cluster, guild cache, presence."""
+
+    def __init__(self, upstream, guilds: Iterable[FakeGuild] = ()):
+        self.upstream = upstream
+        # a process on its own, like the bot without CLUSTER_SOCKET
+        self.cluster = Cluster("")
+        self._guilds = {g.id: g for g in guilds}
+        self.presence_changes = 0
+
+    @property
+    def guilds(self) -> List[FakeGuild]:
+        return list(self._guilds.values())
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self._guilds.get(guild_id)
+
+    def get_channel(self, channel_id: int):
+        return None
+
+    async def wait_until_ready(self):
+        return None
+
+    async def change_presence(self, **kwargs):
+        self.presence_changes += 1
+
+    def is_closed(self) -> bool:
+        return False
@@ -0,0 +1,154 @@
+"""
+Replays an interaction trace recorded with TRACE_FILE through the cogs, against the local upstream stub.
+
+    python -m bench.replay traces.jsonl.gz                # at the recorded pace
+    python -m bench.replay traces.jsonl.gz --speed 10     # 10x faster
+    python -m bench.replay traces.jsonl.gz --speed 0      # everything as fast as possible
+
+Commands other than /app, /status and /certinfo (and components other than /app's) are counted but skipped.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+import discord
+from cogs.traces import KIND_AUTOCOMPLETE, KIND_COMMAND, KIND_COMPONENT, read_trace
+from .fakes import FakeBot, FakeInteraction
+from .run import Bench, Result, point_cogs_at
+from .stub_upstream import StubConfig, StubUpstream
+
+def app_names(events: List[Dict[str, Any]]) -> List[str]:
+    """App names picked in /app, so the stub catalog has them and lookups behave like they did live."""
+    return [
+        e["o"]["name"]
+        for e in events
+        if e["k"] == KIND_COMMAND and e.get("c") == "app" and isinstance((e.get("o") or {}).get("name"), str)
+    ]
+
+class Replay:
+    def __init__(self, events: List[Dict[str, Any]], speed: float, bench: Bench):
+        self.events = events
+        self.speed = speed
+        self.bench = bench
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        # how late events were started compared to the trace, ie how far behind the event loop fell
+        self.lag: List[float] = []
+        self.skipped: Counter = Counter()
+        self.errors = 0
+
+    async def setup(self):
+        self.upstream = self.bench.upstream_mod.UpstreamClient()
+        await self.upstream.start()
+        self.app_cog = self.bench.app_mod.AppCog(FakeBot(self.upstream))
+        self.status_cog = await self.bench.new_status_cog(self.upstream)
+
+    async def close(self):
+        self.status_cog.cog_unload()
+        self.app_cog.cog_unload()
+        await self.upstream.close()
+
+    async def dispatch(self, event: Dict[str, Any]) -> None:
+        kind, name, options = event["k"], event.get("c", ""), event.get("o") or {}
+        if kind == KIND_AUTOCOMPLETE and name == "app":
+            interaction = FakeInteraction(type=discord.InteractionType.autocomplete)
+            await self.app_cog.app_name_autocomplete(interaction, str(options.get(event.get("f"), "") or ""))
+            self.latencies["/app autocomplete"].append(time.perf_counter() - interaction.extras["received_at"])
+            return
+        if kind == KIND_COMMAND and name == "app":
+            interaction = FakeInteraction()
+            await self.app_cog.app.callback(self.app_cog, interaction, name=str(options.get("name") or ""), ephemeral=options.get("ephemeral", True))
+        elif kind == KIND_COMMAND and name in ("status", "certinfo"):
+            interaction = FakeInteraction()
+            command = getattr(self.status_cog, name)
+            await command.callback(self.status_cog, interaction, ephemeral=bool(options.get("ephemeral", False)))
+        elif kind == KIND_COMPONENT and name.startswith(self.bench.app_mod.CUSTOM_ID_PREFIX):
+            interaction = FakeInteraction(type=discord.InteractionType.component, data={"custom_id": name, **options})
+            await self.app_cog.on_interaction(interaction)
+            name = "app component"
+        else:
+            self.skipped[f"{kind} {name}"] += 1
+            return
+        if interaction.latency is not None:
+            self.latencies[f"/{name}" if kind == KIND_COMMAND else name].append(interaction.latency)
+
+    async def _run_one(self, event: Dict[str, Any]):
+        try:
+            await self.dispatch(event)
+        except Exception:
+            self.errors += 1
+            logging.getLogger("bench").exception(f"Replaying {event} failed")
+
+    async def run(self) -> float:
+        tasks = []
+        started = time.perf_counter()
+        for event in self.events:
+            if self.speed > 0:
+                due = started + event["t"] / self.speed
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.lag.append(max(0.0, time.perf_counter() - due))
+            tasks.append(asyncio.create_task(self._run_one(event)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+async def main(args: argparse.Namespace) -> List[Result]:
+    events = sorted(read_trace(args.trace), key=lambda e: e["t"])
+    if args.limit:
+        events = events[: args.limit]
+    stub = StubUpstream(
+        StubConfig(apps=args.apps, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate, seed=args.seed),
+        names=app_names(events),
+    )
+    await stub.start()
+    workdir = tempfile.mkdtemp(prefix="jbapp-replay-")
+    point_cogs_at(stub, workdir)
+    importlib.import_module("cogs.config_manager").ConfigManager.CONFIG_FILE = f"{workdir}/config.json"
+    replay = Replay(events, args.speed, Bench(args, stub, workdir))
+    try:
+        await replay.setup()
+        try:
+            wall = await replay.run()
+        finally:
+            await replay.close()
+    finally:
+        await stub.close()
+
+    span = events[-1]["t"] if events else 0.0
+    print(f"replayed {len(events)} events spanning {span:.1f}s in {wall:.2f}s (speed {args.speed or 'max'})")
+    results = [Result(label, latencies, wall) for label, latencies in sorted(replay.latencies.items())]
+    if replay.lag:
+        results.append(Result("dispatch lag", replay.lag, wall))
+    for result in results:
+        print(result.line())
+    print(f"render cache: {replay.app_cog.render_cache.summary()}")
+    print(f"stub requests: {dict(stub.requests)} failures={stub.failures} errors={replay.errors}")
+    if replay.skipped:
+        print(f"skipped: {dict(replay.skipped)}")
+    return results
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay a recorded interaction trace against local upstream/Discord stand-ins.")
+    parser.add_argument("trace", help="file written with TRACE_FILE")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier, 0 for no waits (default: 1)")
+    parser.add_argument("--limit", type=int, default=0, help="only replay the first N events")
+    parser.add_argument("--apps", type=int, default=5000, help="apps in the stub catalogs (the trace's apps included)")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="± random latency added per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of upstream requests answered with 503")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s %(message)s")
+    args = parse_args()
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([r.as_dict() for r in results], f, indent=2)
@@ -0,0 +1,280 @@
+"""
+Offline benchmarks for the bot, against a local stand-in for the upstream API and fake Discord objects.
+
+    python -m bench.run                      # every scenario with the defaults
+    python -m bench.run app_warm autocomplete --apps 5000 --iterations 2000
+    python -m bench.run announce --guilds 10000 --channel-latency 0.05 --json results.json
+
+Nothing here talks to Discord or jailbreaks.app.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import discord
+from cogs.announcer import percentile
+from .fakes import FakeBot, FakeGuild, FakeInteraction
+from .stub_upstream import StubConfig, StubUpstream
+
+SCENARIOS = ("app_cold", "app_warm", "autocomplete", "find", "announce")
+
+class Result:
+    def __init__(self, name: str, latencies: List[float], wall: float, **extra: Any):
+        self.name = name
+        self.latencies = latencies
+        self.wall = wall
+        self.extra = extra
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "scenario": self.name,
+            "n": len(self.latencies),
+            "wall_seconds": round(self.wall, 4),
+            "throughput_per_second": round(len(self.latencies) / self.wall, 1) if self.wall else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 3),
+            "p90_ms": round(percentile(self.latencies, 90) * 1000, 3),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 3),
+            "max_ms": round(max(self.latencies, default=0.0) * 1000, 3),
+            **self.extra,
+        }
+
+    def line(self) -> str:
+        d = self.as_dict()
+        extra = " ".join(f"{k}={v}" for k, v in self.extra.items())
+        return (
+            f"{self.name:<13} n={d['n']:<6} {d['throughput_per_second']:>10.1f}/s  "
+            f"p50={d['p50_ms']:>9.3f}ms p90={d['p90_ms']:>9.3f}ms p99={d['p99_ms']:>9.3f}ms max={d['max_ms']:>9.3f}ms  {extra}"
+        )
+
+async def run_concurrently(count: int, concurrency: int, make: Callable[[int], Awaitable[Optional[float]]]) -> List[float]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int):
+        async with sem:
+            latency = await make(i)
+            if latency is not None:
+                latencies.append(latency)
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies
+
+def make_queries(names: List[str], count: int, rng: random.Random) -> List[str]:
+    """Mix of what people type: exact names, lowercase, partial names, typos and misses."""
+    queries = []
+    for _ in range(count):
+        name = rng.choice(names)
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(name)
+        elif kind < 0.6:
+            queries.append(name.lower())
+        elif kind < 0.8:
+            queries.append(name[: rng.randint(2, max(2, len(name)))])
+        elif kind < 0.95 and len(name) > 3:
+            i = rng.randrange(len(name) - 1)
+            queries.append(name[:i] + name[i + 1] + name[i] + name[i + 2:])
+        else:
+            queries.append(f"zz{rng.randrange(10**6)}")
+    return queries
+
+class Bench:
+    def __init__(self, args: argparse.Namespace, stub: StubUpstream, workdir: str):
+        self.args = args
+        self.stub = stub
+        self.workdir = workdir
+        self.rng = random.Random(args.seed)
+        # imported only now, the cogs read their upstream URLs from env at import time
+        self.app_mod = importlib.import_module("cogs.app")
+        self.status_mod = importlib.import_module("cogs.status")
+        self.upstream_mod = importlib.import_module("cogs.upstream")
+
+    async def new_app_cog(self):
+        upstream = self.upstream_mod.UpstreamClient()
+        await upstream.start()
+        return self.app_mod.AppCog(FakeBot(upstream)), upstream
+
+    async def new_status_cog(self, upstream, guilds=()):
+        cog = self.status_mod.StatusCog(FakeBot(upstream, guilds))
+        # the benchmarks drive polling and announcements themselves
+        cog.check_status.cancel()
+        cog.retry_deliveries.cancel()
+        return cog
+
+    async def call_app(self, cog, name: str) -> float:
+        interaction = FakeInteraction()
+        await cog.app.callback(cog, interaction, name=name)
+        return interaction.latency
+
+    async def app_cold(self) -> Result:
+        # every call starts with empty caches and a new connection pool, like the first /app after boot
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(self.args.cold_iterations):
+            cog, upstream = await self.new_app_cog()
+            try:
+                latencies.append(await self.call_app(cog, self.rng.choice(self.stub.names)))
+            finally:
+                await upstream.close()
+        return Result("app_cold", latencies, time.perf_counter() - started)
+
+    async def app_warm(self) -> Result:
+        cog, upstream = await self.new_app_cog()
+        try:
+            await self.call_app(cog, self.stub.names[0])
+            queries = make_queries(self.stub.names, self.args.iterations, self.rng)
+            started = time.perf_counter()
+            latencies = await run_concurrently(len(queries), self.args.concurrency, lambda i: self.call_app(cog, queries[i]))
+            wall = time.perf_counter() - started
+            cache = cog.render_cache
+            return Result("app_warm", latencies, wall, render_hit_rate=round(cache.hit_rate, 3))
+        finally:
+            await upstream.close()
+
+    async def autocomplete(self) -> Result:
+        cog, upstream = await self.new_app_cog()
+        try:
+            await cog._get_api_cached()
+            prefixes = [q[: self.rng.randint(1, 6)] for q in make_queries(self.stub.names, self.args.iterations, self.rng)]
+
+            async def one(i: int) -> float:
+                interaction = FakeInteraction(type=discord.InteractionType.autocomplete)
+                await cog.app_name_autocomplete(interaction, prefixes[i])
+                return time.perf_counter() - interaction.extras["received_at"]
+
+            started = time.perf_counter()
+            latencies = await run_concurrently(len(prefixes), self.args.concurrency, one)
+            return Result("autocomplete", latencies, time.perf_counter() - started, apps=len(self.stub.names))
+        finally:
+            await upstream.close()
+
+    async def find(self) -> Result:
+        cog, upstream = await self.new_app_cog()
+        try:
+            await cog._get_api_cached()
+            index = cog._api_index
+            queries = make_queries(self.stub.names, self.args.iterations, self.rng)
+            latencies = []
+            found = 0
+            started = time.perf_counter()
+            for q in queries:
+                t = time.perf_counter()
+                found += index.find(q) is not None
+                latencies.append(time.perf_counter() - t)
+            wall = time.perf_counter() - started
+            return Result("find", latencies, wall, found=found, apps=len(index))
+        finally:
+            await upstream.close()
+
+    async def announce(self) -> Result:
+        config_manager = importlib.import_module("cogs.config_manager").ConfigManager
+        announcer_mod = importlib.import_module("cogs.announcer")
+        guilds = [FakeGuild(self.args.channel_latency, self.args.channel_failure_rate, self.rng) for _ in range(self.args.guilds)]
+        config = {
+            str(g.id): {"channel_id": str(g.channel.id), "ping_role_id": str(g.role.id) if i % 2 else ""}
+            for i, g in enumerate(guilds)
+        }
+        config_manager.CONFIG_FILE = os.path.join(self.workdir, "config.json")
+        with open(config_manager.CONFIG_FILE, "w") as f:
+            json.dump(config, f)
+        config_manager.load()
+
+        upstream = self.upstream_mod.UpstreamClient()
+        await upstream.start()
+        cog = await self.new_status_cog(upstream, guilds)
+        cog.announcer = announcer_mod.Announcer(self.args.announce_concurrency, self.args.announce_rate)
+        fanouts = []
+        send = cog.announcer.send
+
+        async def capture(*a, **kw):
+            stats = await send(*a, **kw)
+            fanouts.append(stats)
+            return stats
+
+        cog.announcer.send = capture
+        try:
+            started = time.perf_counter()
+            await cog.announce_status_change(True)
+            wall = time.perf_counter() - started
+            sent = sum(g.channel.sent for g in guilds)
+            # per delivered message, measured from the start of the fan-out
+            delays = [d for stats in fanouts for d in stats.delays]
+            return Result("announce", delays, wall, guilds=len(guilds), sent=sent, pending=cog.outbox.pending_count())
+        finally:
+            cog.cog_unload()
+            await upstream.close()
+            await config_manager.close()
+
+def point_cogs_at(stub: StubUpstream, workdir: str) -> None:
+    """Env for the cogs: upstream URLs on the stub, state files in workdir, no hub channel."""
+    os.environ["JB_API_BASE_URL"] = stub.base_url
+    os.environ["JB_SITE_BASE_URL"] = stub.base_url
+    os.environ["CATALOG_SNAPSHOT_FILE"] = os.path.join(workdir, "catalog_snapshot.json")
+    os.environ["OUTBOX_DB_FILE"] = os.path.join(workdir, "outbox.db")
+    os.environ["CONFIG_BACKEND"] = "json"
+    os.environ.pop("ANNOUNCE_HUB_CHANNEL_ID", None)
+
+async def main(args: argparse.Namespace) -> List[Result]:
+    stub = StubUpstream(
+        StubConfig(
+            apps=args.apps,
+            latency=args.latency,
+            jitter=args.jitter,
+            failure_rate=args.failure_rate,
+            description_chars=args.description_chars,
+            seed=args.seed,
+        )
+    )
+    await stub.start()
+    workdir = tempfile.mkdtemp(prefix="jbapp-bench-")
+    point_cogs_at(stub, workdir)
+    bench = Bench(args, stub, workdir)
+    results = []
+    try:
+        for name in args.scenarios or SCENARIOS:
+            result = await getattr(bench, name)()
+            print(result.line())
+            results.append(result)
+    finally:
+        await stub.close()
+    print(f"stub requests: {dict(stub.requests)} failures={stub.failures}")
+    return results
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmarks against local upstream/Discord stand-ins.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--apps", type=int, default=5000, help="apps in the stub catalogs")
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per warm scenario")
+    parser.add_argument("--cold-iterations", type=int, default=20, help="calls for app_cold")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent calls in warm scenarios")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="± random latency added per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of upstream requests answered with 503")
+    parser.add_argument("--description-chars", type=int, default=600, help="description size per app (payload size)")
+    parser.add_argument("--guilds", type=int, default=10000, help="configured guilds for announce")
+    parser.add_argument("--channel-latency", type=float, default=0.0, help="fake Discord send latency in seconds")
+    parser.add_argument("--channel-failure-rate", type=float, default=0.0, help="fraction of fake sends that fail")
+    parser.add_argument("--announce-rate", type=float, default=1e9, help="announcer token bucket rate (default: unthrottled)")
+    parser.add_argument("--announce-concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    return args
+
+if __name__ == "__main__":
+    # only warnings from the cogs, the results go to stdout
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s %(message)s")
+    args = parse_args()
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([r.as_dict() for r in results], f, indent=2)
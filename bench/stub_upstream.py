@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+from aiohttp import web
+
+WORDS = (
+    "tweak", "store", "music", "cydia", "signal", "photo", "video", "emu", "nes", "snes", "game", "boy",
+    "clip", "pod", "cast", "note", "scan", "dark", "mode", "sleep", "saver", "rune", "nexus", "scrob",
+    "bit", "kodi", "delta", "ppsspp", "retro", "arch", "term", "shell", "files", "zip", "unc0ver", "odyssey",
+)
+
+class StubConfig:
+    """Knobs for the fake api.jailbreaks.app / jailbreaks.app."""
+
+    def __init__(
+        self,
+        apps: int = 5000,
+        latency: float = 0.02,
+        jitter: float = 0.01,
+        failure_rate: float = 0.0,
+        description_chars: int = 600,
+        screenshots: int = 4,
+        status: str = "Signed",
+        seed: int = 1,
+    ):
+        self.apps = apps
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.description_chars = description_chars
+        self.screenshots = screenshots
+        self.status = status
+        self.seed = seed
+
+def make_app_names(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < count:
+        name = " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 3)))
+        if name in seen:
+            name = f"{name} {len(names)}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+class StubUpstream:
+    """
+    Local aiohttp server standing in for both upstream hosts:
+    /status, /info, /appinfo/all, /stats/<slug> and /json/apps.json.
+    Catalog bodies are built once and served with an ETag, so conditional GETs get 304s
+    like they do in production. Every request waits latency ± jitter and fails with a 503
+    at failure_rate.
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None, names: Sequence[str] = ()):
+        self.config = config or StubConfig()
+        self.rng = random.Random(self.config.seed)
+        # given names first (eg the apps seen in a trace), then generated ones up to config.apps
+        self.names = list(dict.fromkeys(names))
+        known = set(self.names)
+        self.names += [n for n in make_app_names(max(0, self.config.apps - len(self.names)), self.config.seed) if n not in known]
+        self.requests: Counter = Counter()
+        self.failures = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.port = 0
+        self._bodies: Dict[str, bytes] = {}
+        self._etags: Dict[str, str] = {}
+        self._store("/appinfo/all", self._api_catalog())
+        self._store("/json/apps.json", self._site_catalog())
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _store(self, path: str, data: Any) -> None:
+        body = json.dumps(data).encode()
+        self._bodies[path] = body
+        self._etags[path] = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    def _api_catalog(self) -> List[Dict[str, Any]]:
+        filler = ("<p>Lorem ipsum dolor sit amet,<br> consectetur adipiscing elit.</p> " * 50)[: self.config.description_chars]
+        return [
+            {
+                "name": name,
+                "featured": i % 50 == 0,
+                "short_description": f"{name} for iOS",
+                "latest_version": f"{i % 7}.{i % 10}",
+                "developer": f"dev{i % 300}",
+                "category": ("tweaks", "emulators", "media", "utilities")[i % 4],
+                "description": filler,
+                "icon": f"/img/icons/{i}.png",
+                "other_versions": [f"{i % 7}.{v}" for v in range(i % 6)],
+            }
+            for i, name in enumerate(self.names)
+        ]
+
+    def _site_catalog(self) -> List[Dict[str, Any]]:
+        return [
+            {"name": name, "screenshots": [f"/img/screenshots/{i}-{s}.png" for s in range(self.config.screenshots)]}
+            for i, name in enumerate(self.names)
+        ]
+
+    async def _delay_or_fail(self, request: web.Request) -> None:
+        self.requests[request.path.split("/")[1] or "/"] += 1
+        delay = self.config.latency + self.rng.uniform(-self.config.jitter, self.config.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.rng.random() < self.config.failure_rate:
+            self.failures += 1
+            raise web.HTTPServiceUnavailable()
+
+    async def _catalog(self, request: web.Request) -> web.Response:
+        await self._delay_or_fail(request)
+        etag = self._etags[request.path]
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=self._bodies[request.path], content_type="application/json", headers={"ETag": etag})
+
+    async def _status(self, request: web.Request) -> web.Response:
+        await self._delay_or_fail(request)
+        return web.json_response({"status": self.config.status})
+
+    async def _info(self, request: web.Request) -> web.Response:
+        await self._delay_or_fail(request)
+        return web.json_response(
+            {
+                "name": "Benchmark Certificate Ltd.",
+                "status": self.config.status,
+                "expirationDate": "Thu, 01 Jan 2099 00:00:00 GMT",
+                "revocationDate": None,
+            }
+        )
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        await self._delay_or_fail(request)
+        slug = request.match_info["slug"]
+        return web.json_response({"downloads": int(hashlib.md5(slug.encode()).hexdigest()[:6], 16)})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/status", self._status)
+        app.router.add_get("/info", self._info)
+        app.router.add_get("/appinfo/all", self._catalog)
+        app.router.add_get("/json/apps.json", self._catalog)
+        app.router.add_get("/stats/{slug}", self._stats)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
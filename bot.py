@@ -1,64 +1,143 @@
 import os
 import sys
 import discord
+from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
-import traceback
 import aiohttp
 import asyncio
+import time
+from cogs.upstream import UpstreamClient
+from cogs.config_manager import ConfigManager
+from cogs.logs import LogPipeline, get_logger, mark_log_sender, set_log_context
+from cogs.metrics import COMMAND_LATENCY, REGISTRY, MetricsServer
+from cogs.traces import TraceRecorder
+from cogs.cluster import Cluster
 
 # Load environment variables early
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 
-# Global queue used by WebhookStream and the bot's background task
+# stdout / file / webhook logging, started before anything else logs
+log_pipeline = LogPipeline()
+log_pipeline.start()
+log = get_logger("bot")
+
+# Global queue used by the webhook log sink and the bot's background task
 log_queue: asyncio.Queue | None = None
+# Webhook log shipping: lines are collected for a short window and sent as few messages as possible
+LOG_QUEUE_MAX = 5000
+LOG_FLUSH_SECONDS = 2.0
+# room for the ``` fences inside Discord's 2000 character limit
+LOG_CHUNK_CHARS = 1990
+# webhooks allow about 30 messages a minute per channel; discord.py waits out any 429 itself
+LOG_MIN_SEND_INTERVAL = 2.0
+# lines dropped because log_queue was full (newest are dropped, the backlog is kept) or their send failed
+log_dropped = 0
 
-class WebhookStream:
-    def __init__(self, original_stream):
-        self.original_stream = original_stream
+def pack_log_chunks(text: str, limit: int = LOG_CHUNK_CHARS) -> list[str]:
+    """Split text into as few chunks of at most `limit` chars as possible, breaking on line ends."""
+    chunks: list[str] = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current.strip():
+                chunks.append(current)
+            current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            if current.strip():
+                chunks.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        chunks.append(current)
+    return [c.strip("\n") for c in chunks]
 
-    def write(self, message: str):
-        # Always write to original stream
-        try:
-            self.original_stream.write(message)
-            self.original_stream.flush()
-        except Exception:
-            pass
+def enqueue_log(message: str):
+    """Called on the event loop by the webhook log sink with one formatted record."""
+    global log_dropped
+    if log_queue is None:
+        return
+    try:
+        # Non-blocking put; if queue is full, the line is dropped and counted
+        log_queue.put_nowait(message)
+    except asyncio.QueueFull:
+        log_dropped += 1
 
-        if not message or not message.strip():
-            return
+def command_label(interaction: discord.Interaction) -> str:
+    return f"/{interaction.command.qualified_name}" if interaction.command else "unknown"
 
-        # Enqueue message for async processing (if queue exists)
-        global log_queue
-        if log_queue is not None:
-            try:
-                # Non-blocking put; if queue is full or missing, we just skip
-                log_queue.put_nowait(message)
-            except Exception:
-                # As last resort, ignore
-                pass
+def observe_command(interaction: discord.Interaction, outcome: str):
+    received = interaction.extras.get("received_at")
+    if received is not None:
+        COMMAND_LATENCY.observe(time.perf_counter() - received, command_label(interaction), outcome)
 
-    def flush(self):
-        try:
-            self.original_stream.flush()
-        except Exception:
-            pass
+class JBAppTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # command latency is measured from here, before any command code runs
+        interaction.extras["received_at"] = time.perf_counter()
+        # runs in the same task as the command / autocomplete, so their log records get tagged
+        command = interaction.command
+        set_log_context(
+            cog=command.binding.qualified_name.lower().removesuffix("cog") if command and getattr(command, "binding", None) else None,
+            command=f"/{command.qualified_name}" if command else None,
+            guild_id=interaction.guild_id,
+        )
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        observe_command(interaction, "error")
+        await super().on_error(interaction, error)
 
-class JBAppBot(commands.Bot):
+class JBAppBot(commands.AutoShardedBot):
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+        # SHARD_COUNT / SHARD_IDS split the shards over several processes, CLUSTER_SOCKET connects them
+        self.cluster = Cluster()
+        super().__init__(*args, shard_count=self.cluster.shard_count, shard_ids=self.cluster.shard_ids, **kwargs)
         self.log_session: aiohttp.ClientSession | None = None
         self.log_webhook: discord.Webhook | None = None
         self.log_task: asyncio.Task | None = None
+        # webhook log shipping counters: lines merged into a shared message, messages sent
+        self.log_coalesced = 0
+        self.log_sent = 0
+        self._log_dropped_reported = 0
+        self._log_next_send = 0.0
+        # shared pooled client for all upstream (jailbreaks.app) requests
+        self.upstream = UpstreamClient()
+        self.metrics_server = MetricsServer()
+        # opt-in (TRACE_FILE) record of received interactions, for bench/replay.py
+        self.traces = TraceRecorder()
+        REGISTRY.collect(
+            "jbapp_log_queue_depth",
+            "Log lines/records waiting to be shipped",
+            lambda: {
+                ("webhook",): log_queue.qsize() if log_queue is not None else 0,
+                ("records",): log_pipeline.queue.qsize(),
+            },
+            ("queue",),
+        )
+        REGISTRY.collect(
+            "jbapp_log_dropped_total",
+            "Log lines/records dropped because a queue was full, or left out by sampling",
+            lambda: {
+                ("webhook",): log_dropped,
+                ("records",): log_pipeline.handler.dropped,
+                ("sampled",): log_pipeline.sampler.sampled_out,
+            },
+            ("queue",),
+            kind="counter",
+        )
 
     async def setup_hook(self):
         # Initialize log queue in the running loop
         global log_queue
         if WEBHOOK_URL:
             if log_queue is None:
-                log_queue = asyncio.Queue()
+                log_queue = asyncio.Queue(maxsize=LOG_QUEUE_MAX)
+            log_pipeline.webhook.attach(asyncio.get_running_loop(), enqueue_log)
 
             # Create session and webhook bound to this loop
             self.log_session = aiohttp.ClientSession()
@@ -70,43 +149,98 @@ class JBAppBot(commands.Bot):
             # Start background consumer task
             self.log_task = asyncio.create_task(self.log_consumer())
 
+        # Cogs expect the upstream client and guild config to be ready when they load
+        await self.upstream.start()
+        ConfigManager.load()
+        try:
+            await self.metrics_server.start()
+        except OSError:
+            log.exception("Failed to start the metrics endpoint")
+        try:
+            self.traces.start()
+        except OSError:
+            log.exception("Failed to open the trace file, interactions won't be recorded")
+
         # Load Cogs
         await self.load_extension("cogs.status")
         await self.load_extension("cogs.configure")
         await self.load_extension("cogs.app")
 
-        # Sync commands to Discord
-        await self.tree.sync()
+        # after the cogs subscribed, so they get what the leader has already published
+        await self.cluster.start()
+
+        # Sync commands to Discord (once per cluster, they're global)
+        if self.cluster.is_leader:
+            await self.tree.sync()
 
     async def log_consumer(self):
         """
         Background task that reads messages from log_queue and sends them to the webhook.
+        Lines that arrive within LOG_FLUSH_SECONDS of each other are sent together,
+        split into as few messages as fit Discord's limit.
         """
+        global log_dropped
         assert log_queue is not None
+        mark_log_sender()
         while not self.is_closed():
             try:
-                message = await log_queue.get()
+                parts = [await log_queue.get()]
+                # let the rest of a burst of log lines arrive first
+                await asyncio.sleep(LOG_FLUSH_SECONDS)
+                while not log_queue.empty():
+                    parts.append(log_queue.get_nowait())
                 if not self.log_webhook:
                     continue
 
-                # Truncate to Discord limit
-                if len(message) > 1990:
-                    message = message[:1990]
-
-                await self.log_webhook.send(f"```\n{message.strip()}\n```")
+                chunks = pack_log_chunks(self._log_drop_notice() + "".join(parts))
+                self.log_coalesced += max(0, len(parts) - len(chunks))
+                for sent, chunk in enumerate(chunks):
+                    try:
+                        await self._send_log_chunk(chunk)
+                    except Exception:
+                        # this chunk and the rest of the batch are lost, report them with the next one
+                        log_dropped += sum(len(c.splitlines()) for c in chunks[sent:])
+                        raise
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                # If sending fails, write error to original stderr
+                # If sending fails, write error to original stderr (logging it would loop back here)
                 try:
-                    sys.__stderr__.write(f"[WebhookStream Error] Failed to send log: {e}\n")
+                    sys.__stderr__.write(f"[log webhook] Failed to send log: {e}\n")
                     sys.__stderr__.flush()
                 except Exception:
                     pass
 
+    def _log_drop_notice(self) -> str:
+        total = log_dropped + log_pipeline.handler.dropped
+        dropped = total - self._log_dropped_reported
+        if dropped <= 0:
+            return ""
+        self._log_dropped_reported = total
+        return (
+            f"[log] {dropped} lines dropped (queue full or send failed), "
+            f"{self.log_coalesced} lines coalesced into {self.log_sent} messages so far\n"
+        )
+
+    async def _send_log_chunk(self, chunk: str):
+        loop = asyncio.get_running_loop()
+        wait = self._log_next_send - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            await self.log_webhook.send(f"```\n{chunk}\n```")
+        finally:
+            self._log_next_send = loop.time() + LOG_MIN_SEND_INTERVAL
+        self.log_sent += 1
+
+    async def on_interaction(self, interaction: discord.Interaction):
+        self.traces.record(interaction)
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        observe_command(interaction, "ok")
+
     async def on_error(self, event, *args, **kwargs):
-        print(f"An unhandled error occurred in event: {event}")
-        traceback.print_exc()
+        log.exception(f"An unhandled error occurred in event: {event}")
 
     async def close(self):
         # Stop log task first
@@ -124,45 +258,51 @@ class JBAppBot(commands.Bot):
             except Exception:
                 pass
 
-        # Restore original streams
-        if 'original_stdout' in globals():
-            try:
-                sys.stdout = globals().get('original_stdout', sys.stdout)
-            except Exception:
-                pass
-        if 'original_stderr' in globals():
-            try:
-                sys.stderr = globals().get('original_stderr', sys.stderr)
-            except Exception:
-                pass
-
         await super().close()
 
+        # Write out any pending config changes
+        try:
+            await ConfigManager.close()
+        except Exception:
+            log.exception("Failed to write out config on shutdown")
+
+        # Close shared upstream client once cogs are unloaded
+        try:
+            await self.upstream.close()
+        except Exception:
+            pass
+
+        try:
+            await self.metrics_server.close()
+        except Exception:
+            pass
+
+        self.traces.close()
+
+        try:
+            await self.cluster.close()
+        except Exception:
+            pass
+
 def no_prefix_callable(bot, message):
     return []
 
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = JBAppBot(command_prefix=no_prefix_callable, intents=intents)
+bot = JBAppBot(command_prefix=no_prefix_callable, intents=intents, tree_cls=JBAppTree)
 
 @bot.event
 async def on_ready():
-    print(f"Logged in as {bot.user}")
-    print(f"Bot is ready and synced. Found {len(bot.tree.get_commands())} slash commands.")
-
-# Initialize webhook capturing AFTER defining bot but still at import time
-if WEBHOOK_URL:
-    try:
-        original_stdout = sys.stdout
-        original_stderr = sys.stderr
-        sys.stdout = WebhookStream(sys.stdout)
-        sys.stderr = WebhookStream(sys.stderr)
-    except Exception:
-        # If anything goes wrong setting up the webhook capture, fallback to original streams
-        traceback.print_exc()
+    log.info(f"Logged in as {bot.user}")
+    log.info(f"Bot is ready and synced. Found {len(bot.tree.get_commands())} slash commands.")
 
 if DISCORD_TOKEN:
-    bot.run(DISCORD_TOKEN)
+    try:
+        # discord.py logs through the root logger, so it goes to the same sinks
+        bot.run(DISCORD_TOKEN, log_handler=None)
+    finally:
+        log_pipeline.stop()
 else:
-    print("FATAL: DISCORD_TOKEN not found in .env file. Bot cannot start.", file=sys.stderr)
+    log.critical("FATAL: DISCORD_TOKEN not found in .env file. Bot cannot start.")
+    log_pipeline.stop()
@@ -0,0 +1,206 @@
+import asyncio
+import math
+import os
+import time
+from typing import Callable, List, Optional, Union
+import discord
+from .logs import get_logger
+from .metrics import ANNOUNCE_RESULTS
+
+log = get_logger("status.announcer")
+
+ANNOUNCE_CONCURRENCY = 16
+# Discord's global limit is 50 requests/s per bot, leave some room for everything else
+ANNOUNCE_RATE_PER_SECOND = 40.0
+ANNOUNCE_MAX_RATELIMIT_RETRIES = 3
+# optional announcement (news) channel: transitions are published there once and
+# Discord crossposts them to every guild that follows it
+ANNOUNCE_HUB_CHANNEL_ID = int(os.getenv("ANNOUNCE_HUB_CHANNEL_ID") or 0)
+
+# per-guild delivery_mode values
+MODE_DIRECT = "direct"
+MODE_FOLLOW = "follow"
+# outbox key used for the hub message instead of a guild id
+HUB_DELIVERY_ID = "hub"
+
+# per-target delivery results passed to Announcer.send's on_result callback
+RESULT_SENT = "sent"
+RESULT_RETRY = "retry"
+RESULT_FAILED = "failed"
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+class TokenBucket:
+    """Simple async token bucket used as a client-side global rate limit."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        # called when Discord tells us we hit the global limit anyway
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+def get_hub_channel(bot) -> Optional[discord.TextChannel]:
+    if not ANNOUNCE_HUB_CHANNEL_ID:
+        return None
+    channel = bot.get_channel(ANNOUNCE_HUB_CHANNEL_ID)
+    if isinstance(channel, discord.TextChannel) and channel.is_news():
+        return channel
+    return None
+
+class AnnounceTarget:
+    __slots__ = ("guild_id", "channel", "content", "with_embed", "publish", "message_id")
+
+    def __init__(
+        self,
+        guild_id: Union[int, str],
+        channel: discord.abc.Messageable,
+        content: Optional[str],
+        with_embed: bool = True,
+        publish: bool = False,
+        message_id: Optional[int] = None,
+    ):
+        self.guild_id = guild_id
+        self.channel = channel
+        self.content = content
+        # followers of the hub already get the embed, they only need the role ping
+        self.with_embed = with_embed
+        # hub message, crosspost it to following channels after sending
+        self.publish = publish
+        # already sent on an earlier attempt whose publish failed, only the publish is retried;
+        # set again when a publish fails so the outbox can keep it
+        self.message_id = message_id
+
+class FanoutStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        # guilds in an outage, retried later
+        self.deferred = 0
+        self.delays: List[float] = []
+        self.wall_time = 0.0
+
+    @property
+    def p50(self) -> float:
+        return percentile(self.delays, 50)
+
+    @property
+    def p99(self) -> float:
+        return percentile(self.delays, 99)
+
+    def summary(self) -> str:
+        return (
+            f"sent={self.sent} failed={self.failed} skipped={self.skipped} deferred={self.deferred} "
+            f"p50={self.p50:.2f}s p99={self.p99:.2f}s wall={self.wall_time:.2f}s"
+        )
+
+class Announcer:
+    """
+    Sends one prebuilt embed to many channels with bounded concurrency.
+    Per-route buckets are handled by discord.py's HTTP client, the token bucket here keeps
+    the whole run under the global limit so normal command replies aren't starved.
+    """
+
+    def __init__(self, concurrency: int = ANNOUNCE_CONCURRENCY, rate: float = ANNOUNCE_RATE_PER_SECOND):
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate)
+
+    async def send(
+        self,
+        targets: List[AnnounceTarget],
+        embed: discord.Embed,
+        stats: Optional[FanoutStats] = None,
+        on_result: Optional[Callable[[AnnounceTarget, str], None]] = None,
+    ) -> FanoutStats:
+        stats = stats or FanoutStats()
+        sem = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+
+        def finish(target: AnnounceTarget, result: str):
+            ANNOUNCE_RESULTS.inc(result)
+            if result == RESULT_SENT:
+                stats.sent += 1
+                stats.delays.append(time.perf_counter() - start)
+            else:
+                stats.failed += 1
+            if on_result is not None:
+                try:
+                    on_result(target, result)
+                except Exception:
+                    log.exception(f"Failed to record delivery result for guild {target.guild_id}")
+
+        async def send(target: AnnounceTarget) -> Union[discord.Message, str]:
+            # the sent message, or the result to finish with
+            for attempt in range(ANNOUNCE_MAX_RATELIMIT_RETRIES + 1):
+                await self.bucket.acquire()
+                try:
+                    return await target.channel.send(
+                        content=target.content,
+                        embed=embed if target.with_embed else None,
+                    )
+                except discord.RateLimited as e:
+                    # only raised when discord.py decides not to wait itself
+                    self.bucket.pause(e.retry_after)
+                except (discord.Forbidden, discord.NotFound):
+                    # missing permissions or deleted channel, nothing to retry
+                    return RESULT_FAILED
+                except Exception:
+                    log.exception(f"Failed to send announcement to guild {target.guild_id}")
+                    return RESULT_RETRY
+            return RESULT_RETRY
+
+        async def deliver(target: AnnounceTarget):
+            async with sem:
+                if target.message_id is not None:
+                    message = target.channel.get_partial_message(target.message_id)
+                else:
+                    message = await send(target)
+                    if isinstance(message, str):
+                        return finish(target, message)
+                if not target.publish:
+                    return finish(target, RESULT_SENT)
+                # the message is already out, so a failed publish is retried on its own, never as a resend
+                await self.bucket.acquire()
+                try:
+                    await message.publish()
+                except discord.NotFound:
+                    # the hub message was deleted, send it again next time
+                    target.message_id = None
+                    return finish(target, RESULT_RETRY)
+                except discord.Forbidden:
+                    log.error(f"Not allowed to publish in the hub channel of guild {target.guild_id}")
+                    return finish(target, RESULT_FAILED)
+                except Exception:
+                    log.exception(f"Failed to publish announcement in guild {target.guild_id}, retrying later")
+                    target.message_id = message.id
+                    return finish(target, RESULT_RETRY)
+                return finish(target, RESULT_SENT)
+
+        await asyncio.gather(*(deliver(t) for t in targets))
+        stats.wall_time = time.perf_counter() - start
+        return stats
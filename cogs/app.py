@@ -1,26 +1,45 @@
 import os
 import re
 import time
-import sys
-import traceback
-from typing import Any, Dict, List, Optional
+from operator import attrgetter
+from typing import Any, Dict, List, Optional, Tuple
 import aiohttp
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 # the following two are just for the "BOT_INFO" thing in /app, the reason I put it in here is because it's not needed to add ANOTHER command for it.
 import asyncio
 import subprocess
+from .upstream import UpstreamClient
+from .search import AppSearchIndex
+from .catalog import CatalogCache, CatalogSnapshot
+from .downloads import DownloadCounts
+from .loader import RequestLoader
+from .lru import LRUCache
+from .logs import get_logger, set_log_context
+from .metrics import COMMAND_LATENCY, REGISTRY
+
+log = get_logger("app")
 
 API_BASE = os.getenv("JB_API_BASE_URL", "https://api.jailbreaks.app")
 API_ALL = f"{API_BASE}/appinfo/all"
 API_STATS = f"{API_BASE}/stats"
-SITE_APPS_JSON = "https://jailbreaks.app/json/apps.json"
-SITE_BASE = "https://jailbreaks.app"
+SITE_BASE = os.getenv("JB_SITE_BASE_URL", "https://jailbreaks.app")
+SITE_APPS_JSON = f"{SITE_BASE}/json/apps.json"
 INSTALL_BASE = "https://api.jailbreaks.app/install"
 CACHE_TTL_SECONDS = 600
-HTTP_TIMEOUT_SECONDS = 10
-HTTP_RETRIES = 2
+CATALOG_REFRESH_SECONDS = CACHE_TTL_SECONDS * 0.8
+# one batch of stats requests per tick keeps the stats endpoint throttled
+DOWNLOADS_REFRESH_SECONDS = 2
+# per-source deadlines for /app, counted from when the command starts loading
+API_DEADLINE_SECONDS = 12
+SITE_DEADLINE_SECONDS = 3
+CATALOG_SNAPSHOT_FILE = os.getenv("CATALOG_SNAPSHOT_FILE", "catalog_snapshot.json")
+# components on /app replies are routed by AppCog.on_interaction, e.g. "app:ver:<slug>"
+CUSTOM_ID_PREFIX = "app:"
+VERSION_SELECT_ACTION = "ver"
+# prebuilt /app layouts for the most looked-up apps
+RENDER_CACHE_SIZE = 512
 
 def slugify(name: str) -> str:
     s = (name or "").strip().lower()
@@ -44,43 +63,15 @@ def html_to_text(s: str) -> str:
     s = re.sub(r"<[^>]+>", "", s)
     return s.strip()
 
-def find_app(apps: List[Dict[str, Any]], query: str) -> Optional[Dict[str, Any]]:
-    q = (query or "").strip().lower()
-    qn = q.replace(" ", "")
-    for a in apps:
-        name = str(a.get("name", "")).strip()
-        if name and name.lower().replace(" ", "") == qn:
-            return a
-    for a in apps:
-        name = str(a.get("name", "")).strip()
-        if name and q in name.lower():
-            return a
-    return None
-
-async def asyncio_sleep(seconds: float) -> None:
-    import asyncio
-    await asyncio.sleep(seconds)
-
-async def fetch_json_with_retry(session: aiohttp.ClientSession, url: str) -> Any:
-    last_exc: Optional[BaseException] = None
-    for attempt in range(HTTP_RETRIES + 1):
-        try:
-            async with session.get(url) as resp:
-                resp.raise_for_status()
-                return await resp.json()
-        except Exception as e:
-            last_exc = e
-            if attempt < HTTP_RETRIES:
-                await asyncio_sleep(0.4 * (attempt + 1))
-    raise last_exc
-
-async def fetch_downloads(session: aiohttp.ClientSession, app_name: str) -> Optional[int]:
-    url = f"{API_STATS}/{slugify(app_name)}"
-    async with session.get(url) as resp:
-        if resp.status != 200:
+async def fetch_downloads(upstream: UpstreamClient, slug: str) -> Optional[int]:
+    try:
+        data = await upstream.get_json(f"{API_STATS}/{slug}", endpoint=f"{API_STATS}/{{slug}}")
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
             return None
-        data = await resp.json()
-        return data.get("downloads")
+        raise
+    downloads = data.get("downloads") if isinstance(data, dict) else None
+    return downloads if isinstance(downloads, int) else None
 
 def build_header(api_app: Dict[str, Any], downloads: Optional[int]) -> str:
     name = md_escape(api_app.get("name") or "Unknown")
@@ -100,6 +91,13 @@ def build_header(api_app: Dict[str, Any], downloads: Optional[int]) -> str:
     ]
     return "\n".join([x for x in lines if x])
 
+def downloads_bucket(downloads: Optional[int]) -> Optional[int]:
+    if not isinstance(downloads, int):
+        return None
+    # three significant figures, a handful of new installs doesn't rebuild the layout
+    step = 10 ** max(0, len(str(abs(downloads))) - 3)
+    return downloads // step
+
 def build_description(api_app: Dict[str, Any]) -> str:
     desc_html = str(api_app.get("description") or "").strip()
     if not desc_html:
@@ -110,36 +108,110 @@ def build_description(api_app: Dict[str, Any]) -> str:
         desc = desc[:1200].rstrip() + "…"
     return desc
 
-class VersionSelect(discord.ui.Select):
-    def __init__(self, app_name: str, versions: List[str]):
-        self.app_name = app_name
-        options = [
+class AppRecord:
+    """
+    One API catalog entry reduced to what /app shows, escaped and resolved once at ingest.
+    screenshot_urls is filled in by the join with the site catalog, and `version` is the
+    catalog version at which what this app shows last changed.
+    """
+    __slots__ = ("name", "slug", "escaped_name", "header_text", "description", "icon_url", "other_versions", "screenshot_urls", "version")
+
+    def __init__(self, api_app: Dict[str, Any]):
+        self.name = str(api_app.get("name") or "Unknown").strip()
+        self.slug = slugify(self.name)
+        self.escaped_name = md_escape(self.name)
+        self.header_text = build_header(api_app, None)
+        self.description = build_description(api_app)
+        self.icon_url = abs_site_url(str(api_app.get("icon") or ""))
+        versions = api_app.get("other_versions") or []
+        self.other_versions: Tuple[str, ...] = tuple(str(v) for v in versions[:25]) if isinstance(versions, list) else ()
+        self.screenshot_urls: Tuple[str, ...] = ()
+        self.version = 0
+
+    def signature(self) -> Tuple[Any, ...]:
+        return (self.header_text, self.description, self.icon_url, self.other_versions, self.screenshot_urls)
+
+    def header(self, downloads: Optional[int]) -> str:
+        if isinstance(downloads, int):
+            return f"{self.header_text}\n**Downloads:** **{downloads:,}**"
+        return self.header_text
+
+class SiteApp:
+    __slots__ = ("name", "screenshot_urls")
+
+    def __init__(self, name: str, screenshot_urls: Tuple[str, ...]):
+        self.name = name
+        self.screenshot_urls = screenshot_urls
+
+class SiteCatalog:
+    """The site apps.json reduced to screenshots per app, keyed by slug."""
+
+    def __init__(self, site_apps: List[Any]):
+        entries: List[SiteApp] = []
+        self.by_slug: Dict[str, SiteApp] = {}
+        for a in site_apps:
+            if not isinstance(a, dict):
+                continue
+            name = str(a.get("name") or "").strip()
+            screenshots = a.get("screenshots") or []
+            if not name or not isinstance(screenshots, list):
+                continue
+            urls = tuple(u for u in (abs_site_url(str(x)) for x in screenshots[:10]) if u)
+            entry = SiteApp(name, urls)
+            entries.append(entry)
+            self.by_slug.setdefault(slugify(name), entry)
+        self.index = AppSearchIndex(entries, attrgetter("name"))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def match(self, record: AppRecord) -> Optional[SiteApp]:
+        # no typo matching here, a near miss would show another app's screenshots
+        return self.by_slug.get(record.slug) or self.index.find(record.name, fuzzy=False)
+
+def ingest_api_catalog(api_apps: List[Any]) -> List[AppRecord]:
+    return [AppRecord(a) for a in api_apps if isinstance(a, dict) and str(a.get("name") or "").strip()]
+
+class RenderedApp:
+    """The parts of an AppLayout that only depend on the record and its download count."""
+    __slots__ = ("header", "gallery_items", "version_options")
+
+    def __init__(self, app: AppRecord, downloads: Optional[int]):
+        self.header = app.header(downloads)
+        self.gallery_items = [
+            discord.components.MediaGalleryItem(url, description=f"{app.escaped_name} screenshot")
+            for url in app.screenshot_urls
+        ]
+        self.version_options = [
             discord.SelectOption(
                 label=md_escape(v),
-                value=str(v),
-                description=f"Install {app_name} {v}",
+                value=v,
+                description=f"Install {app.name} {v}",
             )
-            for v in (versions or [])[:25]
+            for v in app.other_versions
         ]
+
+def detached(view: discord.ui.View) -> discord.ui.View:
+    # a stopped view still renders but isn't kept in the view store, so a reply holds
+    # no objects in memory and its components keep working after a restart
+    view.stop()
+    return view
+
+class VersionSelect(discord.ui.Select):
+    """Handled by AppCog.on_interaction through its custom_id, there is no callback here."""
+
+    def __init__(self, slug: str, options: List[discord.SelectOption]):
         super().__init__(
             placeholder="Install an older version…",
             min_values=1,
             max_values=1,
-            options=options,
-            custom_id=f"app:ver:{slugify(app_name)}",
-        )
-
-    async def callback(self, interaction: discord.Interaction):
-        v = self.values[0]
-        url = f"{INSTALL_BASE}/{slugify(self.app_name)}/{v}"
-        await interaction.response.send_message(
-            f"**Install {md_escape(self.app_name)} {md_escape(v)}:**\n{url}",
-            ephemeral=True,
+            options=list(options),
+            custom_id=f"{CUSTOM_ID_PREFIX}{VERSION_SELECT_ACTION}:{slug}",
         )
 
 class NotFoundLayout(discord.ui.LayoutView):
     def __init__(self, query: str):
-        super().__init__(timeout=60)
+        super().__init__(timeout=None)
         container = discord.ui.Container(accent_color=0xED4245, id=1)
         container.add_item(
             discord.ui.TextDisplay(
@@ -152,124 +224,242 @@ class NotFoundLayout(discord.ui.LayoutView):
 class AppLayout(discord.ui.LayoutView):
     def __init__(
         self,
-        api_app: Dict[str, Any],
-        site_app: Optional[Dict[str, Any]],
-        downloads: Optional[int],
+        app: AppRecord,
+        rendered: RenderedApp,
+        stale_since: Optional[float] = None,
     ):
-        super().__init__(timeout=180)
-        raw_name = str(api_app.get("name") or "Unknown")
-        icon = abs_site_url(str(api_app.get("icon") or ""))
-        description = build_description(api_app)
-        other_versions = api_app.get("other_versions") or []
-        screenshots = (site_app or {}).get("screenshots") or []
+        super().__init__(timeout=None)
         container = discord.ui.Container(accent_color=0x5865F2, id=1)
-        thumb = discord.ui.Thumbnail(icon, description=f"{md_escape(raw_name)} icon", id=2) if icon else None
+        thumb = discord.ui.Thumbnail(app.icon_url, description=f"{app.escaped_name} icon", id=2) if app.icon_url else None
         section = discord.ui.Section(accessory=thumb, id=3)
-        section.add_item(discord.ui.TextDisplay(build_header(api_app, downloads), id=4))
+        section.add_item(discord.ui.TextDisplay(rendered.header, id=4))
         container.add_item(section)
-        if description:
-            container.add_item(discord.ui.TextDisplay(description, id=9))
-        if isinstance(screenshots, list) and screenshots:
+        if app.description:
+            container.add_item(discord.ui.TextDisplay(app.description, id=9))
+        if rendered.gallery_items:
             container.add_item(discord.ui.TextDisplay("**Screenshots**", id=10))
-            items: List[discord.components.MediaGalleryItem] = []
-            for s in screenshots[:10]:
-                url = abs_site_url(str(s))
-                if url:
-                    items.append(
-                        discord.components.MediaGalleryItem(
-                            url,
-                            description=f"{md_escape(raw_name)} screenshot",
-                        )
-                    )
-            if items:
-                container.add_item(discord.ui.MediaGallery(*items, id=5))
+            container.add_item(discord.ui.MediaGallery(*rendered.gallery_items, id=5))
         row = discord.ui.ActionRow(id=6)
-        row.add_item(discord.ui.Button(label="Install Latest", url=f"{INSTALL_BASE}/{slugify(raw_name)}"))
+        row.add_item(discord.ui.Button(label="Install Latest", url=f"{INSTALL_BASE}/{app.slug}"))
         row.add_item(discord.ui.Button(label="Website", url=SITE_BASE))
         container.add_item(row)
-        if isinstance(other_versions, list) and other_versions:
+        if rendered.version_options:
             container.add_item(discord.ui.TextDisplay("**Older versions**", id=7))
             pick_row = discord.ui.ActionRow(id=8)
-            pick_row.add_item(VersionSelect(raw_name, other_versions))
+            pick_row.add_item(VersionSelect(app.slug, rendered.version_options))
             container.add_item(pick_row)
+        if stale_since:
+            container.add_item(discord.ui.TextDisplay(f"-# App info from <t:{int(stale_since)}:R>, couldn't refresh it from jailbreaks.app", id=11))
         self.add_item(container)
 
 class AppCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self._api_cache: List[Dict[str, Any]] = []
-        self._api_cache_time = 0.0
-        self._site_cache: List[Dict[str, Any]] = []
-        self._site_cache_time = 0.0
-        import asyncio
-        self._api_lock = asyncio.Lock()
-        self._site_lock = asyncio.Lock()
-        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
-        self._session = aiohttp.ClientSession(timeout=timeout)
-
-    async def cog_unload(self) -> None:
+        # only the cluster leader refreshes the catalogs, the other processes get its copies
+        self.cluster = bot.cluster
+        # catalog name -> version last sent to the cluster
+        self._shared_versions: Dict[str, int] = {}
+        # rebuilt whenever the API catalog is refreshed
+        self._api_index = AppSearchIndex([], attrgetter("name"))
+        self._api_slugs: List[str] = []
+        self._by_slug: Dict[str, AppRecord] = {}
+        validators = bot.upstream.validators
+        self.api_catalog = CatalogCache(
+            "API app list", API_ALL, self._fetch_catalog, CACHE_TTL_SECONDS, self._set_api_records, validators, ingest_api_catalog,
+            lambda: self.cluster.is_leader, self._catalog_fetched,
+        )
+        self.site_catalog = CatalogCache(
+            "site apps JSON", SITE_APPS_JSON, self._fetch_catalog, CACHE_TTL_SECONDS, self._set_site_catalog, validators, SiteCatalog,
+            lambda: self.cluster.is_leader, self._catalog_fetched,
+        )
+        self.snapshot = CatalogSnapshot(CATALOG_SNAPSHOT_FILE)
+        self.downloads = DownloadCounts(self._fetch_downloads)
+        self.render_cache = LRUCache(RENDER_CACHE_SIZE)
+        # app name -> (signature, version) as of the last join
+        self._signatures: Dict[str, Tuple[Tuple[Any, ...], int]] = {}
+        REGISTRY.collect(
+            "jbapp_catalog_age_seconds",
+            "Seconds since each app catalog was last fetched",
+            lambda: {(c.name,): c.age() for c in (self.api_catalog, self.site_catalog) if c.fetched_at},
+            ("cache",),
+        )
+        REGISTRY.collect(
+            "jbapp_catalog_refresh_failures_total",
+            "Failed catalog and download count fetches",
+            lambda: {
+                **{(c.name,): c.failures for c in (self.api_catalog, self.site_catalog)},
+                ("download counts",): self.downloads.failures,
+            },
+            ("cache",),
+            kind="counter",
+        )
+        REGISTRY.collect(
+            "jbapp_catalog_failing",
+            "1 while the last refresh of a catalog failed, labelled with the error type (full error in the logs)",
+            lambda: {
+                (c.name, c.last_error.partition("(")[0] if c.last_error else ""): 1 if c.last_error else 0
+                for c in (self.api_catalog, self.site_catalog)
+            },
+            ("cache", "error"),
+        )
+        REGISTRY.collect(
+            "jbapp_render_cache_total",
+            "/app render cache lookups and removals",
+            lambda: {
+                ("hit",): self.render_cache.hits,
+                ("miss",): self.render_cache.misses,
+                ("eviction",): self.render_cache.evictions,
+                ("invalidation",): self.render_cache.invalidations,
+            },
+            ("result",),
+            kind="counter",
+        )
+
+    async def cog_load(self):
+        self.cluster.subscribe("catalog", self.on_cluster_catalog)
+        self.cluster.subscribe("downloads", self.on_cluster_downloads)
+        # serve the last saved catalogs right away, the refresh loop revalidates them
         try:
-            await self._session.close()
+            entries = await asyncio.to_thread(self.snapshot.load)
+            for cache in (self.api_catalog, self.site_catalog):
+                if isinstance(entries.get(cache.url), dict):
+                    cache.restore(entries[cache.url])
         except Exception:
-            print("[app] Failed to close aiohttp session", file=sys.stderr)
-            traceback.print_exc()
-
-    async def _get_api_cached(self) -> List[Dict[str, Any]]:
-        now = time.time()
-        if self._api_cache and (now - self._api_cache_time) < CACHE_TTL_SECONDS:
-            return self._api_cache
-        async with self._api_lock:
-            now = time.time()
-            if self._api_cache and (now - self._api_cache_time) < CACHE_TTL_SECONDS:
-                return self._api_cache
-            try:
-                apps = await fetch_json_with_retry(self._session, API_ALL)
-                self._api_cache = apps if isinstance(apps, list) else []
-                self._api_cache_time = now
-                return self._api_cache
-            except Exception:
-                print(f"[app] Failed to fetch API app list: {API_ALL}", file=sys.stderr)
-                traceback.print_exc()
-                raise
-
-    async def _get_site_cached(self) -> List[Dict[str, Any]]:
-        now = time.time()
-        if self._site_cache and (now - self._site_cache_time) < CACHE_TTL_SECONDS:
-            return self._site_cache
-        async with self._site_lock:
-            now = time.time()
-            if self._site_cache and (now - self._site_cache_time) < CACHE_TTL_SECONDS:
-                return self._site_cache
-            try:
-                apps = await fetch_json_with_retry(self._session, SITE_APPS_JSON)
-                self._site_cache = apps if isinstance(apps, list) else []
-                self._site_cache_time = now
-                return self._site_cache
-            except Exception:
-                print(f"[app] Failed to fetch site apps JSON: {SITE_APPS_JSON}", file=sys.stderr)
-                traceback.print_exc()
-                raise
+            log.exception(f"Failed to load catalog snapshot: {CATALOG_SNAPSHOT_FILE}")
+        self.refresh_catalogs.start()
+        self.refresh_downloads.start()
+
+    def cog_unload(self):
+        self.refresh_catalogs.cancel()
+        self.refresh_downloads.cancel()
+        self.cluster.unsubscribe("catalog", self.on_cluster_catalog)
+        self.cluster.unsubscribe("downloads", self.on_cluster_downloads)
+
+    @property
+    def upstream(self) -> UpstreamClient:
+        return self.bot.upstream
+
+    async def _fetch_catalog(self, url: str) -> Tuple[Any, Optional[bytes]]:
+        return await self.upstream.get_json_body(url)
+
+    async def _fetch_downloads(self, slug: str) -> Optional[int]:
+        return await fetch_downloads(self.upstream, slug)
+
+    def _join_site(self) -> None:
+        site: SiteCatalog = self.site_catalog.data
+        for record in self.api_catalog.data:
+            match = site.match(record)
+            record.screenshot_urls = match.screenshot_urls if match else ()
+        self._stamp_versions()
+
+    def _stamp_versions(self) -> None:
+        # an app keeps its version (and its cached layout) until a refresh changes what it shows
+        catalog_version = self.api_catalog.version + self.site_catalog.version
+        signatures: Dict[str, Tuple[Tuple[Any, ...], int]] = {}
+        for record in self.api_catalog.data:
+            if record.name in signatures:
+                # find() always returns the first app with a given name
+                continue
+            sig = record.signature()
+            old = self._signatures.get(record.name)
+            if old is not None and old[0] == sig:
+                record.version = old[1]
+            else:
+                record.version = catalog_version
+                self.render_cache.invalidate(record.name)
+            signatures[record.name] = (sig, record.version)
+        for name in self._signatures.keys() - signatures.keys():
+            self.render_cache.invalidate(name)
+        self._signatures = signatures
+
+    def _render(self, record: AppRecord, downloads: Optional[int]) -> RenderedApp:
+        tag = (record.version, downloads_bucket(downloads))
+        rendered = self.render_cache.get(record.name, tag)
+        if rendered is None:
+            rendered = RenderedApp(record, downloads)
+            self.render_cache.put(record.name, tag, rendered)
+        return rendered
+
+    def _set_api_records(self, records: List[AppRecord]) -> None:
+        self._join_site()
+        self._api_index = AppSearchIndex(records, attrgetter("name"))
+        self._api_slugs = [r.slug for r in records]
+        self._by_slug = {}
+        for r in records:
+            self._by_slug.setdefault(r.slug, r)
+
+    def _set_site_catalog(self, site: SiteCatalog) -> None:
+        self._join_site()
+
+    def _catalog_fetched(self) -> None:
+        # only after a real fetch, restored or adopted copies are already on disk and on the other processes.
+        # One writer per snapshot file; shared right away since the body is dropped once it's written
+        if self.cluster.is_leader:
+            self.share_catalogs()
+            self.snapshot.save_soon([self.api_catalog, self.site_catalog])
+
+    def share_catalogs(self) -> None:
+        # the body only goes out when it changed, otherwise followers just learn it's still fresh
+        for cache in (self.api_catalog, self.site_catalog):
+            message: Dict[str, Any] = {"name": cache.name, "fetched_at": cache.fetched_at}
+            if self._shared_versions.get(cache.name) != cache.version:
+                entry = cache.snapshot_entry()
+                if entry is None:
+                    continue
+                message.update(entry)
+                self._shared_versions[cache.name] = cache.version
+            self.cluster.publish("catalog", message, key=f"catalog:{cache.name}")
+
+    async def on_cluster_catalog(self, data: Dict[str, Any]):
+        for cache in (self.api_catalog, self.site_catalog):
+            if cache.name == data.get("name"):
+                cache.adopt(data)
+
+    async def on_cluster_downloads(self, data: Dict[str, Any]):
+        # slug -> count; what a follower gets on connecting can be up to DOWNLOADS_TTL_SECONDS old, close enough
+        self.downloads.adopt(data, time.time())
+
+    async def _get_api_cached(self) -> List[AppRecord]:
+        return await self.api_catalog.get()
+
+    async def _get_site_cached(self) -> SiteCatalog:
+        return await self.site_catalog.get()
+
+    @tasks.loop(seconds=CATALOG_REFRESH_SECONDS)
+    async def refresh_catalogs(self):
+        # refresh ahead of the ttl so requests never have to wait on upstream
+        if not self.cluster.is_leader:
+            return
+        try:
+            await asyncio.gather(self.api_catalog.refresh(), self.site_catalog.refresh(), return_exceptions=True)
+            self.share_catalogs()
+        except Exception:
+            log.exception("Catalog refresh loop failed")
+
+    @tasks.loop(seconds=DOWNLOADS_REFRESH_SECONDS)
+    async def refresh_downloads(self):
+        # the leader fetches the counts for the whole cluster
+        if not self.cluster.is_leader:
+            return
+        try:
+            counts = await self.downloads.refresh_batch(self._api_slugs)
+            if counts:
+                # keyed by slug so the cluster merges every batch into what later followers get
+                self.cluster.publish("downloads", counts)
+        except Exception:
+            log.exception("Download count refresh failed")
 
     async def app_name_autocomplete(
         self, interaction: discord.Interaction, current: str
     ) -> List[app_commands.Choice[str]]:
+        received = interaction.extras.get("received_at", time.perf_counter())
         try:
-            apps = await self._get_api_cached()
+            await self._get_api_cached()
         except Exception:
+            COMMAND_LATENCY.observe(time.perf_counter() - received, "/app autocomplete", "error")
             return []
-        cur = (current or "").lower().strip()
-        prefix: List[str] = []
-        contains: List[str] = []
-        for a in apps:
-            nm = str(a.get("name") or "").strip()
-            if not nm:
-                continue
-            low = nm.lower()
-            if not cur or low.startswith(cur):
-                prefix.append(nm)
-            elif cur in low:
-                contains.append(nm)
-        results = (prefix + contains)[:25]
+        results = self._api_index.complete(current, 25)
+        COMMAND_LATENCY.observe(time.perf_counter() - received, "/app autocomplete", "ok")
         return [app_commands.Choice(name=r, value=r) for r in results]
 
     @app_commands.command(name="app", description="Show an app from Jailbreaks.app")
@@ -280,10 +470,6 @@ class AppCog(commands.Cog):
     @app_commands.autocomplete(name=app_name_autocomplete)
     async def app(self, interaction: discord.Interaction, name: str, ephemeral: bool = True):
         await interaction.response.defer(ephemeral=ephemeral)
-        try:
-            api_apps = await self._get_api_cached()
-        except Exception:
-            return await interaction.followup.send("Failed to fetch app list from the API.", ephemeral=ephemeral)
 
         if name.strip().lower() == "rune":
             embed = discord.Embed(
@@ -332,33 +518,76 @@ class AppCog(commands.Cog):
             )
             embed.add_field(name="Ping", value=ping, inline=False)
             embed.add_field(name="Commit", value=commit, inline=False)
+            embed.add_field(name="Render cache", value=self.render_cache.summary(), inline=False)
 
             await interaction.followup.send(embed=embed, ephemeral=ephemeral)
             return
 
-        api_app = find_app(api_apps, name)
-        if not api_app:
-            return await interaction.followup.send(view=NotFoundLayout(name), ephemeral=ephemeral)
+        # both catalogs load at once; the site one only adds screenshots so it gets a short deadline
+        loader = RequestLoader()
+        loader.add("api", self._get_api_cached(), API_DEADLINE_SECONDS)
+        loader.add("site", self._get_site_cached(), SITE_DEADLINE_SECONDS)
 
-        downloads: Optional[int] = None
-        try:
-            downloads = await fetch_downloads(self._session, str(api_app.get("name") or name))
-        except Exception:
-            print(f"[app] Failed to fetch downloads for: {api_app.get('name') or name}", file=sys.stderr)
-            traceback.print_exc()
-            downloads = None
+        # neither early reply needs the site catalog, it finishes (and is timed) in the background
+        api = await loader.get("api")
+        if not api.ok:
+            log.error(f"/app failed: {loader.summary()}")
+            return await interaction.followup.send("Failed to fetch app list from the API.", ephemeral=ephemeral)
 
-        site_app: Optional[Dict[str, Any]] = None
-        try:
-            site_apps = await self._get_site_cached()
-            site_app = find_app(site_apps, str(api_app.get("name") or name))
-        except Exception:
-            site_app = None
+        record: Optional[AppRecord] = self._api_index.find(name)
+        if not record:
+            return await interaction.followup.send(view=detached(NotFoundLayout(name)), ephemeral=ephemeral)
+
+        # from memory only, a miss gets fetched by refresh_downloads in the background
+        downloads = self.downloads.get(record.slug)
+
+        # screenshots were joined onto the record when the site catalog came in
+        site = await loader.get("site")
+        if not site.ok:
+            log.warning(f"/app sent without fresh site data: {loader.summary()}")
 
+        # also marked while the breaker is open, the copy won't be refreshed until upstream recovers
+        stale = self.api_catalog.stale or self.upstream.circuit_open(API_ALL)
+        stale_since = self.api_catalog.fetched_at if stale else None
         await interaction.followup.send(
-            view=AppLayout(api_app, site_app, downloads),
+            view=detached(AppLayout(record, self._render(record, downloads), stale_since)),
             ephemeral=ephemeral,
         )
 
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        if interaction.type != discord.InteractionType.component:
+            return
+        custom_id = str((interaction.data or {}).get("custom_id") or "")
+        if not custom_id.startswith(CUSTOM_ID_PREFIX):
+            return
+        action, _, slug = custom_id[len(CUSTOM_ID_PREFIX):].partition(":")
+        set_log_context(cog="app", command=custom_id, guild_id=interaction.guild_id)
+        try:
+            if action == VERSION_SELECT_ACTION:
+                await self._send_install_link(interaction, slug)
+        except Exception:
+            log.exception(f"Failed to handle component {custom_id}")
+            try:
+                await interaction.response.send_message("An unexpected error occurred while handling interaction.", ephemeral=True)
+            except Exception:
+                log.exception("Failed to send the error reply")
+
+    async def _send_install_link(self, interaction: discord.Interaction, slug: str):
+        values = (interaction.data or {}).get("values") or []
+        if not slug or not values:
+            return
+        v = str(values[0])
+        # only for its side effect: a catalog restored from the snapshot is decoded on first use,
+        # which is what fills _by_slug (via _set_api_records); the records themselves aren't needed here
+        self.api_catalog.peek()
+        record = self._by_slug.get(slug)
+        app_name = record.name if record else slug
+        url = f"{INSTALL_BASE}/{slug}/{v}"
+        await interaction.response.send_message(
+            f"**Install {md_escape(app_name)} {md_escape(v)}:**\n{url}",
+            ephemeral=True,
+        )
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(AppCog(bot))
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from .upstream import CachedResponse, CircuitOpenError, ValidatorCache
+from .files import write_atomic
+from .logs import get_logger
+from .metrics import CACHE_LOOKUPS
+
+log = get_logger("app.catalog")
+
+class CatalogUnavailable(Exception):
+    """No copy of the catalog yet and this process isn't allowed to fetch one."""
+
+class CatalogCache:
+    """
+    Last good copy of one catalog URL (stale-while-revalidate).
+    get() only waits on upstream when there is no copy at all; otherwise it returns the
+    copy it has and, if that's past ttl, kicks off a refresh in the background.
+    A failed refresh keeps the old copy in service and is counted in `failures`.
+    `version` goes up every time the content actually changes.
+    With `ingest`, each new body is turned into the model the cog serves from and the raw
+    JSON dicts are dropped. `fetch` returns (data, body as received); the body is only held
+    until the snapshot has been written from it. `on_fetch` runs only when a fetch brought
+    new content, not when a restored or adopted copy is decoded.
+    While `may_fetch` returns False (cluster followers) upstream is never asked: get() serves
+    whatever copy it was given however old, and raises CatalogUnavailable when there is none.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        fetch: Callable[[str], Awaitable[Tuple[Any, Optional[bytes]]]],
+        ttl: float,
+        on_update: Optional[Callable[[Any], None]] = None,
+        validators: Optional[ValidatorCache] = None,
+        ingest: Optional[Callable[[List[Any]], Any]] = None,
+        may_fetch: Optional[Callable[[], bool]] = None,
+        on_fetch: Optional[Callable[[], None]] = None,
+    ):
+        self.name = name
+        self.url = url
+        self.fetch = fetch
+        self.ttl = ttl
+        self.on_update = on_update
+        self.validators = validators
+        self.ingest = ingest
+        self.may_fetch = may_fetch
+        self.on_fetch = on_fetch
+        self.data: Any = ingest([]) if ingest is not None else []
+        # last fetched body, until CatalogSnapshot writes it out
+        self.body: Optional[str] = None
+        self.fetched_at = 0.0
+        self.version = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._inflight: Optional[asyncio.Task] = None
+        # body restored from the on-disk snapshot, only decoded when first needed
+        self._raw: Optional[Dict[str, Any]] = None
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at if self.fetched_at else float("inf")
+
+    @property
+    def stale(self) -> bool:
+        return self.age() >= self.ttl
+
+    def restore(self, entry: Dict[str, Any]) -> None:
+        if self.data or not isinstance(entry.get("body"), str):
+            return
+        self._raw = entry
+        self.fetched_at = float(entry.get("fetched_at") or 0.0)
+
+    def adopt(self, entry: Dict[str, Any]) -> None:
+        """Takes a copy another cluster process fetched: a snapshot_entry(), or just fetched_at when unchanged."""
+        fetched_at = float(entry.get("fetched_at") or 0.0)
+        body = entry.get("body")
+        # the leader only sends the body when it changed
+        if isinstance(body, str):
+            self._raw = entry
+            self._decode_restored()
+        if self.data or self._raw is not None:
+            self.fetched_at = max(self.fetched_at, fetched_at)
+
+    def _decode_restored(self) -> None:
+        entry, self._raw = self._raw, None
+        if entry is None:
+            return
+        started = time.perf_counter()
+        try:
+            data = json.loads(entry["body"])
+        except json.JSONDecodeError:
+            self.fetched_at = 0.0
+            return
+        if self.validators is not None and (entry.get("etag") or entry.get("last_modified")):
+            # lets the first revalidation after a restart be a 304
+            self.validators.entries[self.url] = CachedResponse(
+                entry.get("etag"), entry.get("last_modified"), data, len(entry["body"]), time.perf_counter() - started
+            )
+        # already on disk, or on the leader's
+        self._set_data(data)
+
+    def snapshot_entry(self) -> Optional[Dict[str, Any]]:
+        if self._raw is not None:
+            return self._raw
+        if not self.data or self.body is None:
+            return None
+        cached = self.validators.entries.get(self.url) if self.validators is not None else None
+        return {
+            "fetched_at": self.fetched_at,
+            "etag": cached.etag if cached else None,
+            "last_modified": cached.last_modified if cached else None,
+            "body": self.body,
+        }
+
+    def peek(self) -> Any:
+        # whatever copy is in memory or on disk, never waits on upstream
+        self._decode_restored()
+        return self.data
+
+    async def get(self) -> Any:
+        self._decode_restored()
+        fetches = self.may_fetch is None or self.may_fetch()
+        if not self.data:
+            CACHE_LOOKUPS.inc(self.name, "miss")
+            if not fetches:
+                raise CatalogUnavailable(f"{self.name} hasn't been received from the cluster leader yet")
+            return await self.refresh()
+        if self.stale:
+            CACHE_LOOKUPS.inc(self.name, "stale")
+            if fetches:
+                self._start_refresh()
+        else:
+            CACHE_LOOKUPS.inc(self.name, "hit")
+        return self.data
+
+    async def refresh(self) -> Any:
+        # concurrent callers share one upstream request
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._refresh())
+            self._inflight.add_done_callback(self._refresh_done)
+        return self._inflight
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        if self._inflight is task:
+            self._inflight = None
+        # retrieve the exception so background failures don't warn as "never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def _refresh(self) -> Any:
+        self._decode_restored()
+        try:
+            data, body = await self.fetch(self.url)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = repr(e)
+            if self.data and isinstance(e, CircuitOpenError):
+                # the breaker already logged why, keep serving what we have
+                log.debug(f"Not refreshing {self.name}: {e}")
+                return self.data
+            if self.data:
+                log.exception(f"Failed to refresh {self.name}: {self.url}, serving copy from {self.age():.0f}s ago")
+                return self.data
+            log.exception(f"Failed to fetch {self.name}: {self.url}")
+            raise
+        self.fetched_at = time.time()
+        self.last_error = None
+        # a 304 hands back the very same object, nothing to rebuild
+        if data is not self.data:
+            self._set_data(data, body.decode("utf-8", "replace") if body is not None else None)
+            if self.on_fetch is not None:
+                self.on_fetch()
+        return self.data
+
+    def _set_data(self, data: Any, body: Optional[str] = None) -> None:
+        raw = data if isinstance(data, list) else []
+        self.data = self.ingest(raw) if self.ingest is not None else raw
+        self.body = body
+        cached = self.validators.entries.get(self.url) if self.validators is not None else None
+        if cached is not None:
+            # a 304 then hands back the ingested model, not the raw dicts
+            cached.data = self.data
+        self.version += 1
+        if self.on_update is not None:
+            self.on_update(self.data)
+
+class CatalogSnapshot:
+    """
+    On-disk copy of the catalogs (body, fetch time, validators) so a restart can serve
+    /app straight away and revalidate in the background. Bodies are stored as raw JSON
+    strings and only parsed when a catalog is first used.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._save_task: Optional[asyncio.Task] = None
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        catalogs = data.get("catalogs") if isinstance(data, dict) else None
+        return catalogs if isinstance(catalogs, dict) else {}
+
+    def save_soon(self, caches: List[CatalogCache], delay: float = 5.0) -> None:
+        # both catalogs usually refresh together, write them out once
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_later(caches, delay))
+
+    async def _save_later(self, caches: List[CatalogCache], delay: float) -> None:
+        await asyncio.sleep(delay)
+        entries = {cache.url: cache.snapshot_entry() for cache in caches}
+        # revalidated since the body was written, only the fetch time moved
+        fetched_at = {cache.url: cache.fetched_at for cache in caches if entries[cache.url] is None and cache.data}
+        try:
+            await asyncio.to_thread(self._write, {url: e for url, e in entries.items() if e is not None}, fetched_at)
+        except Exception:
+            log.exception(f"Failed to write catalog snapshot: {self.path}")
+            return
+        for cache in caches:
+            entry = entries[cache.url]
+            # unless a newer fetch replaced it meanwhile, the body is on disk now and can go
+            if entry is not None and cache.body is entry["body"]:
+                cache.body = None
+
+    def _write(self, entries: Dict[str, Dict[str, Any]], fetched_at: Dict[str, float]) -> None:
+        # catalogs whose body was already written (or never fetched) keep what's in the file
+        catalogs = self.load()
+        for url, when in fetched_at.items():
+            if isinstance(catalogs.get(url), dict):
+                catalogs[url]["fetched_at"] = when
+        catalogs.update(entries)
+        write_atomic(self.path, json.dumps({"catalogs": catalogs}))
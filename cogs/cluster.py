@@ -0,0 +1,238 @@
+import asyncio
+import fcntl
+import json
+import os
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from .logs import get_logger
+
+log = get_logger("cluster")
+
+# catalog messages carry the whole catalog body
+CLUSTER_MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+# a follower with this much unread output is disconnected (it reconnects and gets the latest copies)
+CLUSTER_MAX_BACKLOG_BYTES = 2 * CLUSTER_MAX_MESSAGE_BYTES
+# followers wait this long (plus jitter) before trying to take over or reconnect
+CLUSTER_RETRY_SECONDS = 1.0
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+def parse_shard_ids(value: str) -> Optional[List[int]]:
+    """ "0-3,8" -> [0, 1, 2, 3, 8]; empty -> None (every shard). """
+    ids: List[int] = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        ids.extend(range(int(start), int(end or start) + 1))
+    return sorted(set(ids)) or None
+
+class Cluster:
+    """
+    Lets several bot processes split the shards between them (SHARD_COUNT / SHARD_IDS) while
+    only one of them talks to upstream. The process holding the lock on CLUSTER_SOCKET.lock is
+    the leader: it polls the status, refreshes the catalogs and publishes the results on the
+    UNIX socket CLUSTER_SOCKET. The others connect to it and hand each message to the cogs
+    that subscribed to its kind. The lock goes away with its process, so when the leader dies
+    a follower takes over.
+    Without CLUSTER_SOCKET the process is on its own, always leads and publish() does nothing.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self.socket_path = socket_path if socket_path is not None else os.getenv("CLUSTER_SOCKET", "")
+        self.shard_count = int(os.getenv("SHARD_COUNT") or 0) or None
+        self.shard_ids = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+        if self.shard_ids is not None and self.shard_count is None:
+            raise ValueError("SHARD_IDS needs SHARD_COUNT")
+        if self.socket_path and self.shard_ids is None:
+            # every process would run every shard and announce to every guild
+            raise ValueError("CLUSTER_SOCKET needs SHARD_COUNT and SHARD_IDS")
+        self.name = os.getenv("CLUSTER_NAME") or (
+            f"shards-{self.shard_ids[0]}-{self.shard_ids[-1]}" if self.shard_ids else "main"
+        )
+        self.is_leader = not self.enabled
+        self._handlers: Dict[str, List[Handler]] = {}
+        # last message per key, sent to followers when they connect
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._task: Optional[asyncio.Task] = None
+        # last handler run started per kind, the next message of that kind waits for it
+        self._dispatching: Dict[str, asyncio.Task] = {}
+        self._handler_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.socket_path)
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether the guild is on one of this process's shards."""
+        if self.shard_ids is None:
+            return True
+        return (int(guild_id) >> 22) % self.shard_count in self.shard_ids
+
+    def instance_path(self, path: str) -> str:
+        """Per-process variant of a state file, eg outbox.db -> outbox-shards-0-3.db."""
+        if not self.enabled:
+            return path
+        root, ext = os.path.splitext(path)
+        return f"{root}-{self.name}{ext}"
+
+    def subscribe(self, kind: str, handler: Handler) -> None:
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def unsubscribe(self, kind: str, handler: Handler) -> None:
+        try:
+            self._handlers.get(kind, []).remove(handler)
+        except ValueError:
+            pass
+
+    def publish(self, kind: str, data: Dict[str, Any], key: Optional[str] = None) -> None:
+        """
+        Sends a message to every follower (leader only).
+        Messages with the same key are merged into the copy new followers get when they connect.
+        """
+        if not self.enabled or not self.is_leader:
+            return
+        key = key or kind
+        latest = self._latest.get(key)
+        merged = {**latest["data"], **data} if latest else data
+        self._latest[key] = {"kind": kind, "data": merged}
+        line = self._encode({"kind": kind, "data": data})
+        for writer in list(self._peers):
+            self._write(writer, line)
+
+    def _encode(self, message: Dict[str, Any]) -> bytes:
+        return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+    def _write(self, writer: asyncio.StreamWriter, line: bytes) -> None:
+        if writer.is_closing():
+            self._peers.discard(writer)
+            return
+        if writer.transport.get_write_buffer_size() > CLUSTER_MAX_BACKLOG_BYTES:
+            log.warning("Dropping a cluster follower that stopped reading")
+            self._peers.discard(writer)
+            writer.close()
+            return
+        writer.write(line)
+
+    async def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        # the first election happens before start() returns, so setup can tell if it leads
+        if self._try_lock():
+            await self._lead()
+        self._task = asyncio.create_task(self._run())
+
+    def _try_lock(self) -> bool:
+        fd = os.open(f"{self.socket_path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _lead(self) -> None:
+        # whoever held the lock before is gone, its socket file is stale
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(self._serve_follower, self.socket_path)
+        self.is_leader = True
+        log.info(f"{self.name} is the cluster leader on {self.socket_path}")
+
+    async def _serve_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._peers.add(writer)
+        for message in self._latest.values():
+            self._write(writer, self._encode(message))
+        try:
+            # followers don't send anything, this only notices them leaving
+            await reader.read()
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _run(self) -> None:
+        while not self.is_leader:
+            try:
+                await self._follow()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Cluster connection failed")
+            await asyncio.sleep(CLUSTER_RETRY_SECONDS + random.uniform(0, CLUSTER_RETRY_SECONDS))
+            if self._try_lock():
+                await self._lead()
+
+    async def _follow(self) -> None:
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=CLUSTER_MAX_MESSAGE_BYTES)
+        except OSError:
+            # the leader hasn't bound the socket yet, or just died
+            return
+        log.info(f"{self.name} is following the cluster leader on {self.socket_path}")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._dispatch(json.loads(line))
+        finally:
+            writer.close()
+        log.warning(f"{self.name} lost the cluster leader, trying to take over")
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        # handlers run in their own task so a slow one (eg an announcement fan-out) doesn't stop
+        # the socket being read; messages of one kind are still handled in order
+        kind = message.get("kind")
+        task = asyncio.create_task(self._handle(kind, message.get("data") or {}, self._dispatching.get(kind)))
+        self._dispatching[kind] = task
+        self._handler_tasks.add(task)
+        task.add_done_callback(self._handled)
+
+    def _handled(self, task: asyncio.Task) -> None:
+        self._handler_tasks.discard(task)
+        for kind, latest in list(self._dispatching.items()):
+            if latest is task:
+                del self._dispatching[kind]
+
+    async def _handle(self, kind: Optional[str], data: Dict[str, Any], previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.wait({previous})
+        for handler in list(self._handlers.get(kind, ())):
+            try:
+                await handler(data)
+            except Exception:
+                log.exception(f"Cluster handler for {kind} failed")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._handler_tasks):
+            task.cancel()
+        self._handler_tasks.clear()
+        self._dispatching.clear()
+        for writer in list(self._peers):
+            writer.close()
+        self._peers.clear()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.is_leader = not self.enabled
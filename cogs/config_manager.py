@@ -1,17 +1,313 @@
+import asyncio
 import json
+import os
+import sqlite3
+from typing import Callable, Dict, List, Optional, Tuple
+from .files import write_atomic
+from .logs import get_logger
+
+log = get_logger("config")
+
+GuildConfig = Dict[str, str]
+# a failed config write is tried again after this long
+FLUSH_RETRY_SECONDS = 10.0
+
+def _read_json_file(path: str) -> Dict[str, GuildConfig]:
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {str(k): dict(v) for k, v in data.items() if isinstance(v, dict)}
+
+class JsonConfigBackend:
+    """
+    Per-guild settings, loaded once and kept in memory.
+    Writes go through a lock and are flushed to the file shortly after (write-behind),
+    using a temp file + rename so the file is never half written.
+    """
+
+    def __init__(self, path: str, flush_delay: float):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._guilds: Dict[str, GuildConfig] = {}
+        self._dirty: set = set()
+        self._lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def load(self) -> None:
+        self._guilds = _read_json_file(self.path)
+        self._dirty = set()
+
+    def get_guild(self, gid: str) -> GuildConfig:
+        # copy so callers can't change the store without going through update_guild
+        return dict(self._guilds.get(gid, {}))
+
+    def all_guilds(self) -> List[Tuple[str, GuildConfig]]:
+        return [(gid, dict(cfg)) for gid, cfg in self._guilds.items()]
+
+    def announce_targets(self) -> List[Tuple[str, GuildConfig]]:
+        return [(gid, dict(cfg)) for gid, cfg in self._guilds.items() if cfg.get("channel_id")]
+
+    async def update_guild(self, gid: str, changes: GuildConfig) -> GuildConfig:
+        async with self._lock:
+            guild_cfg = dict(self._guilds.get(gid, {}))
+            guild_cfg.update(changes)
+            self._guilds[gid] = guild_cfg
+            self._mark_dirty(gid)
+        return dict(guild_cfg)
+
+    async def reset_guild(self, gid: str) -> bool:
+        async with self._lock:
+            if self._guilds.pop(gid, None) is None:
+                return False
+            self._mark_dirty(gid)
+        return True
+
+    def _mark_dirty(self, gid: str) -> None:
+        self._dirty.add(gid)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        # batch every change made during the delay into one write
+        delay = self.flush_delay
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush()
+                delay = self.flush_delay
+            except Exception:
+                log.exception(f"Failed to write config file, retrying in {FLUSH_RETRY_SECONDS:.0f}s")
+                delay = FLUSH_RETRY_SECONDS
+            # changes made while the file was being written, or the ones a failed write put back;
+            # _mark_dirty didn't start a task for them since this one was still running
+            if not self._dirty:
+                return
+
+    async def flush(self) -> None:
+        # the write lock keeps an older snapshot from landing after a newer one
+        async with self._write_lock:
+            async with self._lock:
+                if not self._dirty:
+                    return
+                payload = json.dumps(self._guilds, indent=4)
+                flushed, self._dirty = self._dirty, set()
+            try:
+                await asyncio.to_thread(write_atomic, self.path, payload)
+            except Exception:
+                # keep those guilds marked dirty so the next flush retries
+                self._dirty.update(flushed)
+                raise
+
+    def close(self) -> None:
+        pass
+
+class SqliteConfigBackend:
+    """
+    One row per guild in a WAL-mode SQLite database.
+    Lookups and updates go through the primary key and announce_targets uses the
+    channel_id index, so nothing scans every guild.
+    """
+    COLUMNS = ("channel_id", "ping_role_id", "approved_role_id")
+
+    def __init__(self, path: str, json_path: str):
+        self.path = path
+        self.json_path = json_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    def load(self) -> None:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS guild_config (
+                guild_id TEXT PRIMARY KEY,
+                channel_id TEXT,
+                ping_role_id TEXT,
+                approved_role_id TEXT,
+                extra TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS idx_guild_config_channel
+                ON guild_config(channel_id) WHERE channel_id IS NOT NULL;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        conn.commit()
+        self._conn = conn
+        self._import_json_once()
+
+    def _import_json_once(self) -> None:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+        if row:
+            return
+        guilds = _read_json_file(self.json_path)
+        with self._conn:
+            for gid, cfg in guilds.items():
+                self._upsert(gid, cfg)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (self.json_path,))
+        if guilds:
+            log.info(f"Imported {len(guilds)} guild(s) from {self.json_path} into {self.path}")
+
+    def _row_to_cfg(self, row) -> GuildConfig:
+        cfg: GuildConfig = {}
+        for key, value in zip(self.COLUMNS, row[1:4]):
+            if value:
+                cfg[key] = value
+        try:
+            cfg.update(json.loads(row[4] or "{}"))
+        except json.JSONDecodeError:
+            pass
+        return cfg
+
+    def _upsert(self, gid: str, cfg: GuildConfig) -> None:
+        extra = {k: v for k, v in cfg.items() if k not in self.COLUMNS}
+        self._conn.execute(
+            """
+            INSERT INTO guild_config (guild_id, channel_id, ping_role_id, approved_role_id, extra)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(guild_id) DO UPDATE SET
+                channel_id = excluded.channel_id,
+                ping_role_id = excluded.ping_role_id,
+                approved_role_id = excluded.approved_role_id,
+                extra = excluded.extra
+            """,
+            (gid, *(cfg.get(k) or None for k in self.COLUMNS), json.dumps(extra)),
+        )
+
+    def get_guild(self, gid: str) -> GuildConfig:
+        row = self._conn.execute("SELECT * FROM guild_config WHERE guild_id = ?", (gid,)).fetchone()
+        return self._row_to_cfg(row) if row else {}
+
+    def all_guilds(self) -> List[Tuple[str, GuildConfig]]:
+        rows = self._conn.execute("SELECT * FROM guild_config").fetchall()
+        return [(row[0], self._row_to_cfg(row)) for row in rows]
+
+    def announce_targets(self) -> List[Tuple[str, GuildConfig]]:
+        rows = self._conn.execute("SELECT * FROM guild_config WHERE channel_id IS NOT NULL").fetchall()
+        return [(row[0], self._row_to_cfg(row)) for row in rows]
+
+    async def update_guild(self, gid: str, changes: GuildConfig) -> GuildConfig:
+        async with self._lock:
+            guild_cfg = self.get_guild(gid)
+            guild_cfg.update(changes)
+            with self._conn:
+                self._upsert(gid, guild_cfg)
+        return guild_cfg
+
+    async def reset_guild(self, gid: str) -> bool:
+        async with self._lock:
+            with self._conn:
+                cur = self._conn.execute("DELETE FROM guild_config WHERE guild_id = ?", (gid,))
+        return cur.rowcount > 0
+
+    async def flush(self) -> None:
+        # every update is committed straight away
+        pass
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
 
 class ConfigManager:
+    """
+    Guild settings store used by the cogs.
+    CONFIG_BACKEND=json (default) keeps everything in config.json,
+    CONFIG_BACKEND=sqlite uses CONFIG_DB_FILE and imports config.json the first time.
+    With CLUSTER_SOCKET set sqlite is always used, since every process of the cluster writes to it.
+    """
     CONFIG_FILE = "config.json"
+    DB_FILE = "config.db"
+    FLUSH_DELAY_SECONDS = 2.0
+
+    _backend = None
+    # called with (guild_id, new config or None when reset) after every change
+    _listeners: List[Callable[[str, Optional[GuildConfig]], None]] = []
+
+    @classmethod
+    def add_listener(cls, callback: Callable[[str, Optional[GuildConfig]], None]) -> None:
+        cls._listeners.append(callback)
 
-    @staticmethod
-    def load_config():
+    @classmethod
+    def remove_listener(cls, callback: Callable[[str, Optional[GuildConfig]], None]) -> None:
         try:
-            with open(ConfigManager.CONFIG_FILE, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-
-    @staticmethod
-    def save_config(config):
-        with open(ConfigManager.CONFIG_FILE, "w") as f:
-            json.dump(config, f, indent=4)
+            cls._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    @classmethod
+    def _notify(cls, gid: str, cfg: Optional[GuildConfig]) -> None:
+        for callback in list(cls._listeners):
+            try:
+                callback(gid, cfg)
+            except Exception:
+                log.exception(f"Config listener failed for guild {gid}")
+
+    @classmethod
+    def load(cls) -> None:
+        # env is read here rather than at import so .env has been loaded by then
+        backend_name = os.getenv("CONFIG_BACKEND", "json").strip().lower()
+        if os.getenv("CLUSTER_SOCKET") and backend_name != "sqlite":
+            # each process would keep its own copy of config.json and overwrite the others' changes
+            log.warning(f"CONFIG_BACKEND={backend_name} can't be shared by a cluster, using sqlite instead")
+            backend_name = "sqlite"
+        if cls._backend is not None:
+            cls._backend.close()
+        if backend_name == "sqlite":
+            cls._backend = SqliteConfigBackend(os.getenv("CONFIG_DB_FILE", cls.DB_FILE), cls.CONFIG_FILE)
+        else:
+            cls._backend = JsonConfigBackend(cls.CONFIG_FILE, cls.FLUSH_DELAY_SECONDS)
+        cls._backend.load()
+
+    @classmethod
+    def _get_backend(cls):
+        if cls._backend is None:
+            cls.load()
+        return cls._backend
+
+    @classmethod
+    def get_guild(cls, guild_id) -> GuildConfig:
+        return cls._get_backend().get_guild(str(guild_id))
+
+    @classmethod
+    def all_guilds(cls) -> List[Tuple[str, GuildConfig]]:
+        return cls._get_backend().all_guilds()
+
+    @classmethod
+    def announce_targets(cls) -> List[Tuple[str, GuildConfig]]:
+        """Guilds that have an announcement channel set."""
+        return cls._get_backend().announce_targets()
+
+    @classmethod
+    async def update_guild(cls, guild_id, changes: GuildConfig) -> GuildConfig:
+        gid = str(guild_id)
+        cfg = await cls._get_backend().update_guild(gid, changes)
+        cls._notify(gid, dict(cfg))
+        return cfg
+
+    @classmethod
+    async def reset_guild(cls, guild_id) -> bool:
+        gid = str(guild_id)
+        removed = await cls._get_backend().reset_guild(gid)
+        if removed:
+            cls._notify(gid, None)
+        return removed
+
+    @classmethod
+    async def flush(cls) -> None:
+        if cls._backend is not None:
+            await cls._backend.flush()
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls._backend is not None:
+            await cls._backend.flush()
+            cls._backend.close()
+            cls._backend = None
@@ -1,40 +1,116 @@
+from typing import Optional, Tuple
 import discord
 from discord.ext import commands
 from discord import app_commands
 from .config_manager import ConfigManager
-import traceback
-import sys
+from .announcer import ANNOUNCE_HUB_CHANNEL_ID, MODE_DIRECT, MODE_FOLLOW
+from .logs import get_logger, set_log_context
+
+log = get_logger("configure")
+
+async def unfollow_hub(client: discord.Client, webhook_id) -> bool:
+    """Deletes the webhook follow mode created; False if the bot isn't allowed to."""
+    try:
+        webhook = await client.fetch_webhook(int(webhook_id))
+        await webhook.delete(reason="jailbreaks.app status announcements: follow mode turned off")
+    except discord.NotFound:
+        # someone already removed it
+        pass
+    except discord.Forbidden:
+        return False
+    return True
+
+UNFOLLOW_FAILED_NOTE = (
+    " I couldn't remove the old announcement channel follow (I need the Manage Webhooks permission),"
+    " remove it in the channel's Integrations settings or you'll keep getting those announcements."
+)
 
 class ConfigModal(discord.ui.Modal, title="Configure Bot"):
     def __init__(self, guild_id: int):
         super().__init__()
         self.guild_id = guild_id
-        cfg = ConfigManager.load_config().get(str(guild_id), {})
+        cfg = ConfigManager.get_guild(guild_id)
         self.channel_id = discord.ui.TextInput(label="Channel ID for notifications", required=False, default=cfg.get("channel_id", ""))
         self.ping_role_id = discord.ui.TextInput(label="Ping Role ID (optional)", required=False, default=cfg.get("ping_role_id", ""))
         self.approved_role_id = discord.ui.TextInput(label="Approved Role ID (optional)", required=False, default=cfg.get("approved_role_id", ""))
+        self.delivery_mode = discord.ui.TextInput(
+            label="Delivery mode: direct or follow (optional)",
+            placeholder="follow = follow the announcement channel instead of direct messages",
+            required=False,
+            max_length=6,
+            default=cfg.get("delivery_mode", ""),
+        )
         self.add_item(self.channel_id)
         self.add_item(self.ping_role_id)
         self.add_item(self.approved_role_id)
+        self.add_item(self.delivery_mode)
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            cfg = ConfigManager.load_config()
-            guild_cfg = cfg.get(str(self.guild_id), {})
-            if self.channel_id.value: guild_cfg["channel_id"] = self.channel_id.value
-            if self.ping_role_id.value: guild_cfg["ping_role_id"] = self.ping_role_id.value
-            if self.approved_role_id.value: guild_cfg["approved_role_id"] = self.approved_role_id.value
-            cfg[str(self.guild_id)] = guild_cfg
-            ConfigManager.save_config(cfg)
-            await interaction.response.send_message("Configuration saved.", ephemeral=True)
+            # following / unfollowing takes up to three REST calls, more than the 3s before a first response is due
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            changes = {}
+            if self.channel_id.value: changes["channel_id"] = self.channel_id.value
+            if self.ping_role_id.value: changes["ping_role_id"] = self.ping_role_id.value
+            if self.approved_role_id.value: changes["approved_role_id"] = self.approved_role_id.value
+            mode = self.delivery_mode.value.strip().lower()
+            if mode and mode not in (MODE_DIRECT, MODE_FOLLOW):
+                await interaction.followup.send("Delivery mode must be `direct` or `follow`.", ephemeral=True)
+                return
+            prev = ConfigManager.get_guild(self.guild_id)
+            channel_id = changes.get("channel_id") or prev.get("channel_id")
+            new_mode = mode or prev.get("delivery_mode") or MODE_DIRECT
+            # following again would add a second webhook to the same channel
+            stays_followed = (
+                new_mode == MODE_FOLLOW and prev.get("delivery_mode") == MODE_FOLLOW and prev.get("channel_id") == channel_id
+            )
+            if new_mode == MODE_FOLLOW and not stays_followed:
+                webhook_id, note = await self.follow_hub(interaction, channel_id)
+                if note:
+                    await interaction.followup.send(note, ephemeral=True)
+                    return
+                changes["follow_webhook_id"] = str(webhook_id)
+            reply = "Configuration saved."
+            if not stays_followed and prev.get("follow_webhook_id"):
+                # switched to direct or to another channel, the old follow would keep crossposting
+                if not await unfollow_hub(interaction.client, prev["follow_webhook_id"]):
+                    reply += UNFOLLOW_FAILED_NOTE
+                changes.setdefault("follow_webhook_id", "")
+            if mode: changes["delivery_mode"] = mode
+            await ConfigManager.update_guild(self.guild_id, changes)
+            await interaction.followup.send(reply, ephemeral=True)
         except Exception:
-            # Send trace to stderr which should be captured by webhook stream
-            traceback.print_exc()
+            log.exception("Failed to save configuration")
             try:
-                await interaction.response.send_message("An error occurred while saving configuration.", ephemeral=True)
+                await interaction.followup.send("An error occurred while saving configuration.", ephemeral=True)
             except Exception:
-                # In case response fails (rare), fallback to webhook-captured stderr
-                traceback.print_exc(file=sys.stderr)
+                # In case response fails (rare), at least log it
+                log.exception("Failed to send the error reply")
+
+    async def follow_hub(self, interaction: discord.Interaction, channel_id) -> Tuple[Optional[int], str]:
+        """
+        Follows the hub announcement channel into this guild's channel.
+        Returns the id of the webhook that creates (kept so it can be removed again), or an error message.
+        """
+        if not ANNOUNCE_HUB_CHANNEL_ID:
+            return None, "Follow mode isn't available on this bot, use `direct` instead."
+        try:
+            channel = interaction.guild.get_channel(int(channel_id or 0))
+        except ValueError:
+            channel = None
+        if not isinstance(channel, discord.TextChannel):
+            return None, "Set a valid text channel ID before choosing follow mode."
+        # through REST rather than the cached hub channel, which only the process on the hub guild's shard has
+        try:
+            data = await interaction.client.http.follow_webhook(
+                ANNOUNCE_HUB_CHANNEL_ID, webhook_channel_id=channel.id, reason="jailbreaks.app status announcements"
+            )
+        except discord.Forbidden:
+            return None, "I need the Manage Webhooks permission in that channel to follow the announcement channel."
+        except discord.HTTPException:
+            log.exception(f"Failed to follow announcement channel {ANNOUNCE_HUB_CHANNEL_ID}")
+            return None, "Couldn't follow the announcement channel right now, try again later or use `direct`."
+        return int(data["webhook_id"]), ""
 
 class ResetConfirmModal(discord.ui.Modal, title="Confirm Reset"):
     def __init__(self, guild_id: int):
@@ -45,21 +121,26 @@ class ResetConfirmModal(discord.ui.Modal, title="Confirm Reset"):
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
+            # unfollowing can take two REST calls
+            await interaction.response.defer(ephemeral=True, thinking=True)
             if self.confirm.value.upper() == "RESET":
-                cfg = ConfigManager.load_config()
-                if cfg.pop(str(self.guild_id), None):
-                    ConfigManager.save_config(cfg)
-                    await interaction.response.send_message("Settings for this server have been reset.", ephemeral=True)
+                webhook_id = ConfigManager.get_guild(self.guild_id).get("follow_webhook_id")
+                unfollowed = not webhook_id or await unfollow_hub(interaction.client, webhook_id)
+                if await ConfigManager.reset_guild(self.guild_id):
+                    reply = "Settings for this server have been reset."
+                    if not unfollowed:
+                        reply += UNFOLLOW_FAILED_NOTE
+                    await interaction.followup.send(reply, ephemeral=True)
                 else:
-                    await interaction.response.send_message("No settings were found to reset.", ephemeral=True)
+                    await interaction.followup.send("No settings were found to reset.", ephemeral=True)
             else:
-                await interaction.response.send_message("Phrase was typed incorrectly, reset cancelled.", ephemeral=True)
+                await interaction.followup.send("Phrase was typed incorrectly, reset cancelled.", ephemeral=True)
         except Exception:
-            traceback.print_exc()
+            log.exception("Failed to reset configuration")
             try:
-                await interaction.response.send_message("An error occurred while resetting configuration.", ephemeral=True)
+                await interaction.followup.send("An error occurred while resetting configuration.", ephemeral=True)
             except Exception:
-                traceback.print_exc(file=sys.stderr)
+                log.exception("Failed to send the error reply")
 
 class ConfigureCog(commands.Cog):
     def __init__(self, bot):
@@ -79,7 +160,7 @@ class ConfigureCog(commands.Cog):
                 await interaction.response.send_message(embed=embed, ephemeral=True)
                 return
 
-            cfg = ConfigManager.load_config().get(str(interaction.guild_id), {})
+            cfg = ConfigManager.get_guild(interaction.guild_id)
             approved_role_id = cfg.get("approved_role_id")
             member = interaction.user
             # Ensure approved_role_id is treated safely
@@ -88,8 +169,8 @@ class ConfigureCog(commands.Cog):
                 if approved_role_id:
                     has_approved_role = any(role.id == int(approved_role_id) for role in member.roles)
             except Exception:
-                # In case of malformed saved ID or other issues, log to stderr for webhook capture
-                traceback.print_exc()
+                # In case of malformed saved ID or other issues, log it and fall back to admin only
+                log.exception("Failed to check the approved role")
 
             has_permission = member.guild_permissions.administrator or has_approved_role
             if not has_permission:
@@ -113,33 +194,34 @@ class ConfigureCog(commands.Cog):
             )
             await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
         except Exception:
-            # Ensure any unexpected errors are printed to stderr so the webhook capture can send them
-            traceback.print_exc()
+            # Ensure any unexpected errors are logged so they reach the webhook
+            log.exception("Failed to open the configuration panel")
             try:
                 await interaction.response.send_message("An unexpected error occurred while processing the command.", ephemeral=True)
             except Exception:
-                traceback.print_exc(file=sys.stderr)
+                log.exception("Failed to send the error reply")
 
     @commands.Cog.listener()
     async def on_interaction(self, interaction: discord.Interaction):
         if not interaction.guild or interaction.type != discord.InteractionType.component:
             return
         custom_id = interaction.data.get("custom_id")
+        set_log_context(cog="configure", command=custom_id, guild_id=interaction.guild_id)
         try:
             if custom_id == "open_config":
                 await interaction.response.send_modal(ConfigModal(interaction.guild_id))
             elif custom_id == "view_config":
-                cfg = ConfigManager.load_config().get(str(interaction.guild_id), {})
-                desc = "\n".join(f"**{k}**: {v}" for k, v in cfg.items()) if cfg else "No settings configured."
+                cfg = ConfigManager.get_guild(interaction.guild_id)
+                desc = "\n".join(f"**{k}**: {v}" for k, v in cfg.items() if v) or "No settings configured."
                 await interaction.response.send_message(embed=discord.Embed(title="Current Settings", description=desc, color=discord.Color.blue()), ephemeral=True)
             elif custom_id == "reset_config":
                 await interaction.response.send_modal(ResetConfirmModal(interaction.guild_id))
         except Exception:
-            traceback.print_exc()
+            log.exception(f"Failed to handle component {custom_id}")
             try:
                 await interaction.response.send_message("An unexpected error occurred while handling interaction.", ephemeral=True)
             except Exception:
-                traceback.print_exc(file=sys.stderr)
+                log.exception("Failed to send the error reply")
 
 async def setup(bot):
     await bot.add_cog(ConfigureCog(bot))
@@ -0,0 +1,77 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from .logs import get_logger
+from .upstream import CircuitOpenError
+
+log = get_logger("app.downloads")
+
+DOWNLOADS_TTL_SECONDS = 1800
+DOWNLOADS_BATCH_SIZE = 10
+# a failed stats request is tried again after this long instead of on every batch
+DOWNLOADS_RETRY_SECONDS = 60
+
+class DownloadCounts:
+    """
+    Download count per app slug, filled in by a background loop in small batches.
+    get() never waits on the stats endpoint; a miss just moves the app to the front
+    of the next batch. After that, apps people look up most and apps with the most
+    downloads are refreshed first.
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[Optional[int]]], ttl: float = DOWNLOADS_TTL_SECONDS):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.counts: Dict[str, int] = {}
+        self.fetched_at: Dict[str, float] = {}
+        self.hits: Counter = Counter()
+        self._wanted: Set[str] = set()
+        self.failures = 0
+
+    def get(self, slug: str) -> Optional[int]:
+        self.hits[slug] += 1
+        if slug not in self.fetched_at:
+            self._wanted.add(slug)
+        return self.counts.get(slug)
+
+    def due(self, slugs: Iterable[str], limit: int) -> List[str]:
+        now = time.time()
+        stale = [s for s in slugs if now - self.fetched_at.get(s, 0.0) >= self.ttl]
+        stale.sort(key=lambda s: (s not in self._wanted, -self.hits[s], -self.counts.get(s, 0)))
+        return stale[:limit]
+
+    def adopt(self, counts: Dict[str, int], fetched_at: float) -> None:
+        """Takes counts another cluster process fetched."""
+        for slug, count in counts.items():
+            if isinstance(count, int):
+                self.counts[slug] = count
+                self.fetched_at[slug] = fetched_at
+                self._wanted.discard(slug)
+
+    async def refresh_batch(self, slugs: Iterable[str], batch_size: int = DOWNLOADS_BATCH_SIZE) -> Dict[str, int]:
+        """Fetches the most wanted stale counts; returns the ones that came back."""
+        batch = self.due(slugs, batch_size)
+        fetched: Dict[str, int] = {}
+        if not batch:
+            return fetched
+        results = await asyncio.gather(*(self.fetch(s) for s in batch), return_exceptions=True)
+        now = time.time()
+        short_circuited = 0
+        for slug, result in zip(batch, results):
+            self._wanted.discard(slug)
+            if isinstance(result, BaseException):
+                self.failures += 1
+                self.fetched_at[slug] = now - self.ttl + DOWNLOADS_RETRY_SECONDS
+                if isinstance(result, CircuitOpenError):
+                    short_circuited += 1
+                else:
+                    log.error(f"Failed to fetch downloads for: {slug}", exc_info=result)
+                continue
+            self.fetched_at[slug] = now
+            if isinstance(result, int):
+                self.counts[slug] = result
+                fetched[slug] = result
+        if short_circuited:
+            log.warning(f"Skipped {short_circuited} download count(s), the stats endpoint is failing")
+        return fetched
@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+def write_atomic(path: str, payload: str) -> None:
+    """
+    Replaces `path` with `payload` so readers (and a crash) see either the old or the new file,
+    never a partial one: written and fsynced to a temp file in the same directory, then renamed over.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    name = os.path.basename(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, Optional
+from .metrics import SOURCE_LOAD_LATENCY
+
+class SourceResult:
+    __slots__ = ("value", "error", "elapsed", "timed_out")
+
+    def __init__(self):
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.elapsed = 0.0
+        self.timed_out = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.timed_out
+
+    @property
+    def outcome(self) -> str:
+        return "ok" if self.ok else ("timeout" if self.timed_out else "error")
+
+class RequestLoader:
+    """
+    Runs the independent fetches behind one command at the same time, each with its own deadline.
+    A source that fails or runs out of time just comes back as not ok, so optional data
+    can be left out instead of holding up the reply. A source that ran out of time keeps going
+    in the background. Each source's time is taken when it finishes, not when it's asked for,
+    and goes into jbapp_load_seconds (as a timeout if the caller had stopped waiting by then).
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._deadlines: Dict[str, float] = {}
+        self.results: Dict[str, SourceResult] = {}
+        # seconds from the start until each source finished
+        self._finished: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    def add(self, name: str, aw: Awaitable[Any], deadline: float) -> None:
+        task = asyncio.ensure_future(aw)
+        task.add_done_callback(lambda t, name=name: self._on_done(name, t))
+        self._tasks[name] = task
+        self._deadlines[name] = deadline
+
+    def _on_done(self, name: str, task: asyncio.Task) -> None:
+        self._finished[name] = elapsed = time.perf_counter() - self._started
+        if task.cancelled():
+            return
+        # also retrieves the exception, so one nobody waited for doesn't warn as "never retrieved"
+        failed = task.exception() is not None
+        gave_up = name in self.results and self.results[name].timed_out
+        SOURCE_LOAD_LATENCY.observe(elapsed, name, "timeout" if gave_up else ("error" if failed else "ok"))
+
+    async def get(self, name: str) -> SourceResult:
+        if name in self.results:
+            return self.results[name]
+        result = SourceResult()
+        # deadlines count from when the loader started, not from when get() is called
+        remaining = self._deadlines[name] - (time.perf_counter() - self._started)
+        task = self._tasks[name]
+        # not wait_for, which would cancel the source on timeout
+        done, _ = await asyncio.wait({task}, timeout=max(0.0, remaining))
+        if done:
+            try:
+                result.value = task.result()
+            except Exception as e:
+                result.error = e
+        else:
+            result.timed_out = True
+        result.elapsed = self._finished.get(name, time.perf_counter() - self._started)
+        self.results[name] = result
+        return result
+
+    def summary(self) -> str:
+        parts = []
+        for name, task in self._tasks.items():
+            r = self.results.get(name)
+            if r is not None:
+                parts.append(f"{name}={r.elapsed * 1000:.0f}ms({r.outcome})")
+            elif name in self._finished and not task.cancelled():
+                outcome = "error" if task.exception() is not None else "ok"
+                parts.append(f"{name}={self._finished[name] * 1000:.0f}ms({outcome}, unused)")
+            else:
+                parts.append(f"{name}=pending")
+        return " ".join(parts)
@@ -0,0 +1,200 @@
+import asyncio
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+LOGGER_NAME = "jbapp"
+# records waiting for the listener thread; past this they're dropped and counted
+LOG_QUEUE_MAX = 10000
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+TEXT_FORMAT = "%(asctime)s %(levelname)-8s [%(cog)s]%(context)s %(message)s"
+WEBHOOK_FORMAT = "%(levelname)s [%(cog)s]%(context)s %(message)s"
+
+# command / guild the current task is handling, set once per interaction
+_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+# set in the task that sends log lines to the webhook, whatever it logs must not be sent back there
+_sending_logs: contextvars.ContextVar[bool] = contextvars.ContextVar("sending_logs", default=False)
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+def set_log_context(**fields: Any) -> None:
+    # each interaction runs in its own task, so this only tags that interaction's records
+    _context.set({**_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+
+def mark_log_sender() -> None:
+    # called once by the webhook sender task, records it (or discord.py on its behalf) logs stay off the webhook
+    _sending_logs.set(True)
+
+def parse_level(value: Optional[str], default: int) -> int:
+    level = logging.getLevelName((value or "").strip().upper())
+    return level if isinstance(level, int) else default
+
+def parse_sample_rates(value: str) -> Dict[int, float]:
+    """"DEBUG=0.05,INFO=0.5" -> {10: 0.05, 20: 0.5}; unknown or malformed parts are ignored."""
+    rates: Dict[int, float] = {}
+    for part in (value or "").split(","):
+        name, _, rate = part.partition("=")
+        level = parse_level(name, -1)
+        try:
+            if level >= 0:
+                rates[level] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+class ContextFilter(logging.Filter):
+    """Adds cog / command / guild to a record. Runs in the caller's thread, so it sees the task's context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        ctx = _context.get()
+        parts = record.name.split(".")
+        record.cog = ctx.get("cog") or (parts[1] if parts[0] == LOGGER_NAME and len(parts) > 1 else parts[0])
+        record.command = ctx.get("command", "")
+        record.guild_id = ctx.get("guild_id", "")
+        bits = [str(record.command)] if record.command else []
+        if record.guild_id:
+            bits.append(f"guild={record.guild_id}")
+        record.context = f" ({' '.join(bits)})" if bits else ""
+        record.from_log_sender = _sending_logs.get()
+        return True
+
+class WebhookFeedbackFilter(logging.Filter):
+    """
+    Keeps records about sending to webhooks off the webhook: discord.webhook's own (eg its
+    rate limit warnings) and anything logged while a log chunk was being sent. Otherwise every
+    failed or rate limited send would queue more lines to send.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.name == "discord.webhook" or record.name.startswith("discord.webhook."):
+            return False
+        return not getattr(record, "from_log_sender", False)
+
+class SamplingFilter(logging.Filter):
+    """Keeps each record of a level with the configured probability; levels without a rate are all kept."""
+
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: when the queue is full the record is dropped and counted."""
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # format the message and traceback here, args and exc_info may not survive the thread hop
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "cog": getattr(record, "cog", ""),
+            "command": getattr(record, "command", ""),
+            "guild_id": getattr(record, "guild_id", ""),
+            "msg": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class WebhookHandler(logging.Handler):
+    """
+    Hands formatted records to the bot's webhook batcher. emit() runs on the listener thread,
+    so records are passed to the event loop with call_soon_threadsafe. Until attach() is
+    called (setup_hook) records are ignored.
+    """
+
+    def __init__(self, level: int):
+        super().__init__(level)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._submit: Optional[Callable[[str], None]] = None
+
+    def attach(self, loop: asyncio.AbstractEventLoop, submit: Callable[[str], None]) -> None:
+        self._loop = loop
+        self._submit = submit
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._loop is None or self._submit is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._submit, self.format(record) + "\n")
+        except RuntimeError:
+            # loop already closed during shutdown
+            pass
+
+class LogPipeline:
+    """
+    Root logging setup: loggers only put records on a bounded queue, and a QueueListener
+    thread writes them to stdout, the optional JSON-lines file and the webhook.
+    Reads LOG_LEVEL, LOG_SAMPLE, LOG_FILE, LOG_FILE_LEVEL and LOG_WEBHOOK_LEVEL.
+    """
+
+    def __init__(self):
+        self.level = parse_level(os.getenv("LOG_LEVEL"), logging.INFO)
+        self.queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_MAX)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.sampler = SamplingFilter(parse_sample_rates(os.getenv("LOG_SAMPLE", "")))
+        self.handler.addFilter(self.sampler)
+        self.handler.addFilter(ContextFilter())
+
+        stdout = logging.StreamHandler(sys.stdout)
+        stdout.setFormatter(logging.Formatter(TEXT_FORMAT))
+        sinks: List[logging.Handler] = [stdout]
+        log_file = os.getenv("LOG_FILE")
+        if log_file:
+            file_sink = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+            )
+            file_sink.setLevel(parse_level(os.getenv("LOG_FILE_LEVEL"), logging.DEBUG))
+            file_sink.setFormatter(JsonFormatter())
+            sinks.append(file_sink)
+        self.webhook = WebhookHandler(parse_level(os.getenv("LOG_WEBHOOK_LEVEL"), logging.INFO))
+        self.webhook.setFormatter(logging.Formatter(WEBHOOK_FORMAT))
+        self.webhook.addFilter(WebhookFeedbackFilter())
+        sinks.append(self.webhook)
+        self.listener = logging.handlers.QueueListener(self.queue, *sinks, respect_handler_level=True)
+
+    def start(self) -> None:
+        root = logging.getLogger()
+        root.setLevel(self.level)
+        root.addHandler(self.handler)
+        self.listener.start()
+
+    def stop(self) -> None:
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
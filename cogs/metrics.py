@@ -0,0 +1,186 @@
+import math
+import os
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+from .logs import get_logger
+
+log = get_logger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        key = tuple(str(v) for v in labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: count per bucket (last one is +Inf), sum
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = tuple(str(v) for v in labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Collector:
+    """A gauge (or counter) read from existing state when scraped, e.g. a queue size or cache age."""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str], fn: Callable[[], Dict[Labels, float]]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.fn().items()):
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def collect(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], Dict[Labels, float]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge",
+    ) -> None:
+        # replaces an earlier collector of the same name, so a reloaded cog doesn't pile them up
+        self._metrics[name] = Collector(name, help, kind, labelnames, fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                log.exception(f"Failed to collect metric {getattr(metric, 'name', metric)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+COMMAND_LATENCY = REGISTRY.histogram(
+    "jbapp_command_seconds", "Time from receiving an interaction to the command finishing", ("command", "outcome")
+)
+SOURCE_LOAD_LATENCY = REGISTRY.histogram(
+    "jbapp_load_seconds", "Time each data source behind a command took, from the command's start", ("source", "outcome")
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "jbapp_upstream_request_seconds", "Upstream HTTP request time per attempt", ("endpoint",)
+)
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    "jbapp_upstream_responses_total", "Upstream HTTP responses by status code (or error type)", ("endpoint", "status")
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "jbapp_cache_lookups_total", "Catalog cache lookups: hit, stale (served while refreshing) or miss", ("cache", "result")
+)
+POLL_OUTCOMES = REGISTRY.counter(
+    "jbapp_status_polls_total", "check_status results", ("outcome",)
+)
+UPSTREAM_NOT_MODIFIED = REGISTRY.counter(
+    "jbapp_upstream_not_modified_total", "Upstream 304s answered from the validator cache", ("endpoint",)
+)
+UPSTREAM_BYTES_SAVED = REGISTRY.counter(
+    "jbapp_upstream_bytes_saved_total", "Body bytes not downloaded thanks to a 304", ("endpoint",)
+)
+UPSTREAM_PARSE_SECONDS_SAVED = REGISTRY.counter(
+    "jbapp_upstream_parse_seconds_saved_total", "JSON decode time skipped thanks to a 304", ("endpoint",)
+)
+UPSTREAM_BREAKER_TRANSITIONS = REGISTRY.counter(
+    "jbapp_upstream_breaker_transitions_total", "Upstream circuit breaker state changes", ("endpoint", "state")
+)
+ANNOUNCE_RESULTS = REGISTRY.counter(
+    "jbapp_announcements_total", "Announcement deliveries by result", ("result",)
+)
+
+class MetricsServer:
+    """
+    Serves REGISTRY as Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics.
+    Off unless METRICS_PORT is set; env is read here because bot.py imports cogs before load_dotenv().
+    """
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: Optional[str] = None, port: Optional[int] = None):
+        self.registry = registry
+        self.host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+        self.port = port if port is not None else int(os.getenv("METRICS_PORT") or 0)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self) -> None:
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,181 @@
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+from .announcer import RESULT_FAILED, RESULT_RETRY, RESULT_SENT
+
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_BACKOFF_BASE_SECONDS = 15.0
+OUTBOX_BACKOFF_MAX_SECONDS = 600.0
+# finished transitions are kept around this long for debugging
+OUTBOX_RETENTION_SECONDS = 7 * 24 * 3600
+
+STATE_PENDING = "pending"
+STATE_SENT = "sent"
+STATE_FAILED = "failed"
+STATE_SKIPPED = "skipped"
+STATE_SUPERSEDED = "superseded"
+
+class PendingTransition:
+    __slots__ = ("id", "status", "created_at", "guild_ids", "message_ids")
+
+    def __init__(self, transition_id: int, status: str, created_at: float, guild_ids: List[str]):
+        self.id = transition_id
+        self.status = status
+        self.created_at = created_at
+        self.guild_ids = guild_ids
+        # guild_id -> message sent on an earlier attempt that still has to be published
+        self.message_ids: Dict[str, int] = {}
+
+class AnnouncementOutbox:
+    """
+    SQLite-backed record of status transitions and their per-guild deliveries.
+    A transition and all of its pending deliveries are written in one transaction before
+    anything is sent, and each delivery is marked as soon as it finishes, so a restart
+    picks up exactly the guilds that were still pending.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS transitions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS deliveries (
+                transition_id INTEGER NOT NULL,
+                guild_id TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                message_id TEXT,
+                PRIMARY KEY (transition_id, guild_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_deliveries_pending
+                ON deliveries(next_attempt_at) WHERE state = 'pending';
+            """
+        )
+        # outboxes created before hub publishes were retried on their own
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(deliveries)")}
+        if "message_id" not in columns:
+            self._conn.execute("ALTER TABLE deliveries ADD COLUMN message_id TEXT")
+        self._conn.commit()
+
+    def get_last_status(self) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM state WHERE key = 'last_status'").fetchone()
+        return row[0] if row else None
+
+    def set_last_status(self, status: str) -> None:
+        with self._conn:
+            self._set_state("last_status", status)
+
+    def _set_state(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def record_transition(self, status: str, guild_ids: Iterable[str]) -> int:
+        now = time.time()
+        with self._conn:
+            self._set_state("last_status", status)
+            # an older announcement that hasn't gone out yet is now wrong, don't send it
+            self._conn.execute(
+                "UPDATE deliveries SET state = ? WHERE state = ?",
+                (STATE_SUPERSEDED, STATE_PENDING),
+            )
+            cur = self._conn.execute(
+                "INSERT INTO transitions (status, created_at) VALUES (?, ?)",
+                (status, now),
+            )
+            transition_id = cur.lastrowid
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (transition_id, guild_id) VALUES (?, ?)",
+                ((transition_id, str(gid)) for gid in guild_ids),
+            )
+            self._prune(now)
+        return transition_id
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - OUTBOX_RETENTION_SECONDS
+        self._conn.execute(
+            """
+            DELETE FROM deliveries WHERE state != 'pending'
+                AND transition_id IN (SELECT id FROM transitions WHERE created_at < ?)
+            """,
+            (cutoff,),
+        )
+        self._conn.execute(
+            """
+            DELETE FROM transitions WHERE created_at < ?
+                AND id NOT IN (SELECT DISTINCT transition_id FROM deliveries)
+            """,
+            (cutoff,),
+        )
+
+    def due_transitions(self, now: Optional[float] = None) -> List[PendingTransition]:
+        now = time.time() if now is None else now
+        rows = self._conn.execute(
+            """
+            SELECT t.id, t.status, t.created_at, d.guild_id, d.message_id
+            FROM deliveries d JOIN transitions t ON t.id = d.transition_id
+            WHERE d.state = 'pending' AND d.next_attempt_at <= ?
+            ORDER BY t.id
+            """,
+            (now,),
+        ).fetchall()
+        transitions: List[PendingTransition] = []
+        for transition_id, status, created_at, guild_id, message_id in rows:
+            if not transitions or transitions[-1].id != transition_id:
+                transitions.append(PendingTransition(transition_id, status, created_at, []))
+            transitions[-1].guild_ids.append(guild_id)
+            if message_id:
+                transitions[-1].message_ids[guild_id] = int(message_id)
+        return transitions
+
+    def pending_count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM deliveries WHERE state = 'pending'").fetchone()[0]
+
+    def mark(self, transition_id: int, guild_id, state: str) -> None:
+        with self._conn:
+            self._conn.execute(
+                "UPDATE deliveries SET state = ? WHERE transition_id = ? AND guild_id = ?",
+                (state, transition_id, str(guild_id)),
+            )
+
+    def record_result(self, transition_id: int, guild_id, result: str, message_id: Optional[int] = None) -> None:
+        if result == RESULT_SENT:
+            self.mark(transition_id, guild_id, STATE_SENT)
+        elif result == RESULT_FAILED:
+            self.mark(transition_id, guild_id, STATE_FAILED)
+        elif result == RESULT_RETRY:
+            self._schedule_retry(transition_id, str(guild_id), message_id)
+
+    def _schedule_retry(self, transition_id: int, guild_id: str, message_id: Optional[int] = None) -> None:
+        row = self._conn.execute(
+            "SELECT attempts FROM deliveries WHERE transition_id = ? AND guild_id = ?",
+            (transition_id, guild_id),
+        ).fetchone()
+        if not row:
+            return
+        attempts = row[0] + 1
+        with self._conn:
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                self._conn.execute(
+                    "UPDATE deliveries SET state = ?, attempts = ? WHERE transition_id = ? AND guild_id = ?",
+                    (STATE_FAILED, attempts, transition_id, guild_id),
+                )
+                return
+            delay = min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)))
+            self._conn.execute(
+                "UPDATE deliveries SET attempts = ?, next_attempt_at = ?, message_id = ? WHERE transition_id = ? AND guild_id = ?",
+                (attempts, time.time() + delay, str(message_id) if message_id else None, transition_id, guild_id),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,115 @@
+import os
+import random
+import time
+from typing import Optional
+
+# seconds between status polls normally, right after a transition / while upstream is flaky, and once it's been quiet for a while
+POLL_INTERVAL_SECONDS = float(os.getenv("POLL_INTERVAL_SECONDS") or 60)
+POLL_FAST_SECONDS = float(os.getenv("POLL_FAST_SECONDS") or 15)
+POLL_SLOW_SECONDS = float(os.getenv("POLL_SLOW_SECONDS") or 120)
+# how long to keep polling fast after a transition, a flap or an error
+POLL_FAST_WINDOW_SECONDS = float(os.getenv("POLL_FAST_WINDOW_SECONDS") or 600)
+# no transition for this long -> POLL_SLOW_SECONDS
+POLL_STABLE_AFTER_SECONDS = float(os.getenv("POLL_STABLE_AFTER_SECONDS") or 6 * 3600)
+# polls in a row that must agree on a new status before it's announced
+POLL_CONFIRMATIONS = max(1, int(os.getenv("POLL_CONFIRMATIONS") or 2))
+POLL_MAX_BACKOFF_SECONDS = float(os.getenv("POLL_MAX_BACKOFF_SECONDS") or 600)
+# +/- this fraction of random jitter on every interval
+POLL_JITTER = float(os.getenv("POLL_JITTER") or 0.1)
+
+# PollSchedule.observe results
+OBSERVED_SAME = "unchanged"
+OBSERVED_PENDING = "pending"
+OBSERVED_CONFIRMED = "changed"
+OBSERVED_FLAP = "flap"
+
+class PollSchedule:
+    """
+    Decides when check_status polls next and when a different status is trusted.
+    A new status has to be seen `confirmations` polls in a row before it's committed, and
+    polling speeds up while a change is pending, after a transition, a flap or an error,
+    backs off exponentially (with jitter) while polls keep failing, and slows down once
+    nothing has changed for `stable_after` seconds.
+    """
+
+    def __init__(
+        self,
+        interval: float = POLL_INTERVAL_SECONDS,
+        fast: float = POLL_FAST_SECONDS,
+        slow: float = POLL_SLOW_SECONDS,
+        fast_window: float = POLL_FAST_WINDOW_SECONDS,
+        stable_after: float = POLL_STABLE_AFTER_SECONDS,
+        confirmations: int = POLL_CONFIRMATIONS,
+        max_backoff: float = POLL_MAX_BACKOFF_SECONDS,
+        jitter: float = POLL_JITTER,
+        rng: Optional[random.Random] = None,
+    ):
+        self.interval = interval
+        self.fast = min(fast, interval)
+        self.slow = max(slow, interval)
+        self.fast_window = fast_window
+        self.stable_after = stable_after
+        self.confirmations = max(1, confirmations)
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        # status seen but not confirmed yet, and how many polls in a row agreed on it
+        self.candidate: Optional[str] = None
+        self.agreeing = 0
+        self.failures = 0
+        now = time.monotonic()
+        self._changed_at = now
+        self._unsettled_until = 0.0
+        # the last interval handed out, for metrics
+        self.current = interval
+
+    def _unsettle(self, now: float) -> None:
+        self._unsettled_until = now + self.fast_window
+
+    def observe(self, status: str, committed: str) -> str:
+        """Feed one successful poll; returns one of the OBSERVED_* results."""
+        now = time.monotonic()
+        self.failures = 0
+        if status == committed:
+            flapped = self.candidate is not None
+            self.candidate = None
+            self.agreeing = 0
+            if flapped:
+                self._unsettle(now)
+                return OBSERVED_FLAP
+            return OBSERVED_SAME
+        if status == self.candidate:
+            self.agreeing += 1
+        else:
+            self.candidate = status
+            self.agreeing = 1
+        if self.agreeing < self.confirmations:
+            return OBSERVED_PENDING
+        self.candidate = None
+        self.agreeing = 0
+        self._changed_at = now
+        self._unsettle(now)
+        return OBSERVED_CONFIRMED
+
+    def failed(self) -> None:
+        """Feed a failed poll (error, non-200 or unreadable response)."""
+        self.failures += 1
+        self._unsettle(time.monotonic())
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * (1 + self.rng.uniform(-self.jitter, self.jitter))
+
+    def next_interval(self) -> float:
+        now = time.monotonic()
+        if self.failures:
+            # full jitter, so a recovering upstream isn't hit by everyone at the same moment
+            ceiling = min(self.max_backoff, self.fast * 2 ** self.failures)
+            seconds = self.rng.uniform(self.fast, max(self.fast, ceiling))
+        elif self.candidate is not None or now < self._unsettled_until:
+            seconds = self._jittered(self.fast)
+        elif now - self._changed_at >= self.stable_after:
+            seconds = self._jittered(self.slow)
+        else:
+            seconds = self._jittered(self.interval)
+        self.current = max(1.0, seconds)
+        return self.current
@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set
+
+def normalize(name: Any) -> str:
+    return str(name or "").strip().lower()
+
+def trigrams(s: str) -> Set[str]:
+    # padded like pg_trgm so short words and word starts still get trigrams
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+def dict_name(app: Any) -> Any:
+    return app.get("name")
+
+class AppSearchIndex:
+    """
+    Lookup structures for one catalog, built once per refresh.
+    find() keeps the old find_app order (exact name ignoring spaces, then first substring match)
+    and falls back to trigram similarity so misspelled names still resolve.
+    complete() keeps the autocomplete order (prefix matches, then substring matches).
+    Entries can be raw catalog dicts or any record type, `name_of` says where the name is.
+    """
+    FUZZY_THRESHOLD = 0.3
+
+    def __init__(self, apps: List[Any], name_of: Callable[[Any], Any] = dict_name):
+        self.apps: List[Any] = []
+        self.names: List[str] = []
+        self.lowered: List[str] = []
+        for a in apps:
+            name = str(name_of(a) or "").strip()
+            if not name:
+                continue
+            self.apps.append(a)
+            self.names.append(name)
+            self.lowered.append(name.lower())
+
+        self._exact: Dict[str, int] = {}
+        for i, low in enumerate(self.lowered):
+            self._exact.setdefault(low.replace(" ", ""), i)
+
+        order = sorted(range(len(self.lowered)), key=lambda i: self.lowered[i])
+        self._sorted_keys = [self.lowered[i] for i in order]
+        self._sorted_idx = order
+
+        self._postings: Dict[str, List[int]] = {}
+        self._trigram_counts: List[int] = []
+        for i, low in enumerate(self.lowered):
+            grams = trigrams(low)
+            self._trigram_counts.append(len(grams))
+            for g in grams:
+                self._postings.setdefault(g, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.apps)
+
+    def find(self, query: str, fuzzy: bool = True) -> Optional[Any]:
+        q = normalize(query)
+        i = self._exact.get(q.replace(" ", ""))
+        if i is not None:
+            return self.apps[i]
+        contains = self._contains(q)
+        if contains:
+            return self.apps[contains[0]]
+        if not fuzzy:
+            return None
+        close = self._fuzzy(q, 1)
+        return self.apps[close[0]] if close else None
+
+    def complete(self, current: str, limit: int = 25) -> List[str]:
+        cur = normalize(current)
+        if not cur:
+            return self.names[:limit]
+        picked = self._prefix(cur)
+        if len(picked) < limit:
+            seen = set(picked)
+            picked += [i for i in self._contains(cur) if i not in seen]
+        # under 3 letters there's too little to guess a typo from
+        if len(picked) < limit and len(cur) >= 3:
+            seen = set(picked)
+            picked += [i for i in self._fuzzy(cur, limit) if i not in seen]
+        return [self.names[i] for i in picked[:limit]]
+
+    def _prefix(self, cur: str) -> List[int]:
+        lo = bisect_left(self._sorted_keys, cur)
+        # every key starting with cur sorts right after it; walking them can't miss any, whatever
+        # character comes next (a "cur + max char" upper bound leaves out astral ones like emoji)
+        keys = self._sorted_keys
+        hi = lo
+        while hi < len(keys) and keys[hi].startswith(cur):
+            hi += 1
+        # back to catalog order, same as the old linear scan
+        return sorted(self._sorted_idx[lo:hi])
+
+    def _contains(self, q: str) -> List[int]:
+        if len(q) < 3:
+            return [i for i, low in enumerate(self.lowered) if q in low]
+        grams = {q[i:i + 3] for i in range(len(q) - 2)}
+        postings = []
+        for g in grams:
+            p = self._postings.get(g)
+            if not p:
+                return []
+            postings.append(p)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates.intersection_update(p)
+            if not candidates:
+                return []
+        return sorted(i for i in candidates if q in self.lowered[i])
+
+    def _fuzzy(self, q: str, limit: int) -> List[int]:
+        grams = trigrams(q)
+        shared: Counter = Counter()
+        for g in grams:
+            for i in self._postings.get(g, ()):
+                shared[i] += 1
+        scored = []
+        for i, n in shared.items():
+            score = n / (len(grams) + self._trigram_counts[i] - n)
+            if score >= self.FUZZY_THRESHOLD:
+                scored.append((-score, i))
+        scored.sort()
+        return [i for _, i in scored[:limit]]
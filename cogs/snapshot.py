@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+from .upstream import UpstreamClient
+
+class StatusUnavailable(Exception):
+    """No snapshot yet and this process isn't allowed to fetch one."""
+
+class StatusSnapshot:
+    """
+    Immutable view of /status + /info at one point in time.
+    version only goes up when the upstream data actually changed.
+    """
+    __slots__ = ("version", "status", "info", "fetched_at")
+
+    def __init__(self, version: int, status: Dict[str, Any], info: Dict[str, Any], fetched_at: float):
+        self.version = version
+        self.status = status
+        self.info = info
+        self.fetched_at = fetched_at
+
+    @property
+    def signed(self) -> Optional[bool]:
+        status_val = self.status.get("status", "")
+        if status_val == "Signed":
+            return True
+        if status_val == "Revoked":
+            return False
+        return None
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+class StatusStore:
+    """
+    Holds the latest StatusSnapshot. The poller calls refresh(); commands read current.
+    Concurrent refresh() calls share one in-flight upstream request.
+    While `may_fetch` returns False (cluster followers) get() never asks upstream and raises
+    StatusUnavailable until a snapshot has been adopted.
+    """
+
+    def __init__(
+        self, upstream: UpstreamClient, status_url: str, info_url: str, may_fetch: Optional[Callable[[], bool]] = None
+    ):
+        self.upstream = upstream
+        self.status_url = status_url
+        self.info_url = info_url
+        self.may_fetch = may_fetch
+        self.current: Optional[StatusSnapshot] = None
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def get(self) -> StatusSnapshot:
+        # only touches upstream if nothing has been fetched yet
+        if self.current is not None:
+            return self.current
+        if self.may_fetch is not None and not self.may_fetch():
+            raise StatusUnavailable("no status received from the cluster leader yet")
+        return await self.refresh()
+
+    async def refresh(self) -> StatusSnapshot:
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._refresh())
+            self._inflight.add_done_callback(self._clear_inflight)
+        # shield so one caller being cancelled doesn't cancel the shared fetch
+        return await asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, task: asyncio.Task) -> None:
+        if self._inflight is task:
+            self._inflight = None
+
+    async def _refresh(self) -> StatusSnapshot:
+        status, info = await asyncio.gather(
+            self.upstream.get_json(self.status_url),
+            self.upstream.get_json(self.info_url),
+            return_exceptions=True,
+        )
+        # status is required; info can fall back to the previous copy
+        if isinstance(status, BaseException):
+            raise status
+        prev = self.current
+        if isinstance(info, BaseException):
+            if prev is None:
+                raise info
+            info = prev.info
+        return self.adopt(status, info, time.time())
+
+    def adopt(self, status: Any, info: Any, fetched_at: float) -> StatusSnapshot:
+        # also used for snapshots another cluster process fetched
+        prev = self.current
+        status = status if isinstance(status, dict) else {}
+        info = info if isinstance(info, dict) else {}
+
+        if prev is None:
+            version = 1
+        elif prev.status != status or prev.info != info:
+            version = prev.version + 1
+        else:
+            version = prev.version
+        self.current = StatusSnapshot(version, status, info, fetched_at)
+        return self.current
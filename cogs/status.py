@@ -3,24 +3,77 @@ from discord.ext import commands, tasks
 import aiohttp
 from discord import app_commands
 from .config_manager import ConfigManager
+from .snapshot import StatusSnapshot, StatusStore, StatusUnavailable
+from .announcer import ANNOUNCE_HUB_CHANNEL_ID, HUB_DELIVERY_ID, RESULT_RETRY, AnnounceTarget, Announcer, FanoutStats, get_hub_channel
+from .outbox import STATE_SKIPPED, AnnouncementOutbox
+from .targets import TargetTable
+from .logs import get_logger
+from .metrics import POLL_OUTCOMES, REGISTRY
+from .upstream import CircuitOpenError
+from .polling import OBSERVED_CONFIRMED, OBSERVED_FLAP, OBSERVED_PENDING, POLL_INTERVAL_SECONDS, PollSchedule
+import asyncio
 import os
 from email.utils import parsedate_to_datetime
 from textwrap import dedent
-import traceback
 from datetime import datetime
+from typing import Dict, List, Optional
 
-STATUS_URL = "https://api.jailbreaks.app/status"
-INFO_URL = "https://api.jailbreaks.app/info"
+log = get_logger("status")
+
+API_BASE = os.getenv("JB_API_BASE_URL", "https://api.jailbreaks.app")
+STATUS_URL = f"{API_BASE}/status"
+INFO_URL = f"{API_BASE}/info"
 STATUS_NOTE = os.getenv("STATUS_NOTE", "")
+OUTBOX_DB_FILE = os.getenv("OUTBOX_DB_FILE", "outbox.db")
+OUTBOX_RETRY_SECONDS = 30
+# /status and /certinfo say the answer may be out of date past this age (eg a cluster follower whose leader can't reach upstream)
+STATUS_STALE_SECONDS = 900
+# a cluster follower that just started and hasn't been sent a status yet
+STATUS_UNAVAILABLE_MESSAGE = "The status hasn't been loaded yet, please try again in a few seconds."
 
 class StatusCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.last_status = None
+        # only the cluster leader polls upstream, the other processes get its snapshots
+        self.cluster = bot.cluster
+        self.snapshots = StatusStore(bot.upstream, STATUS_URL, INFO_URL, lambda: self.cluster.is_leader)
+        self.announcer = Announcer()
+        # last_status and unfinished announcements survive restarts (one outbox per cluster process)
+        self.outbox = AnnouncementOutbox(self.cluster.instance_path(OUTBOX_DB_FILE))
+        self.last_status = self.outbox.get_last_status()
+        self._first_poll = True
+        # adaptive poll interval and debounce for transitions
+        self.schedule = PollSchedule()
+        self._deliver_lock = asyncio.Lock()
+        # parsed announcement targets, kept current by config saves and gateway events
+        self.targets = TargetTable(self.cluster.owns_guild)
+        self.targets.rebuild(ConfigManager.announce_targets())
+        ConfigManager.add_listener(self.targets.update_guild)
+        self.cluster.subscribe("status", self.on_cluster_status)
+        REGISTRY.collect(
+            "jbapp_status_age_seconds",
+            "Seconds since the signing status was last fetched",
+            lambda: {(): self.snapshots.current.age()} if self.snapshots.current else {},
+        )
+        REGISTRY.collect(
+            "jbapp_pending_announcements",
+            "Announcement deliveries waiting in the outbox",
+            lambda: {(): self.outbox.pending_count()},
+        )
+        REGISTRY.collect(
+            "jbapp_status_poll_interval_seconds",
+            "Seconds until the next status poll was scheduled",
+            lambda: {(): self.schedule.current},
+        )
         self.check_status.start()
+        self.retry_deliveries.start()
 
     def cog_unload(self):
         self.check_status.cancel()
+        self.retry_deliveries.cancel()
+        ConfigManager.remove_listener(self.targets.update_guild)
+        self.cluster.unsubscribe("status", self.on_cluster_status)
+        self.outbox.close()
 
     def to_discord_ts(self, dt_str: str) -> str:
         if not dt_str:
@@ -32,6 +85,13 @@ class StatusCog(commands.Cog):
         except Exception:
             return dt_str
 
+    def freshness_line(self, snap: StatusSnapshot) -> str:
+        line = f"-# Last checked <t:{int(snap.fetched_at)}:R>"
+        if self.bot.upstream.circuit_open(STATUS_URL) or snap.age() > STATUS_STALE_SECONDS:
+            # answered from the last good copy while upstream is failing
+            line += " (jailbreaks.app isn't responding right now, this may be out of date)"
+        return line
+
     async def send_error(self, interaction: discord.Interaction, msg: str):
         embed = discord.Embed(description=msg, color=discord.Color.red())
         await interaction.followup.send(embed=embed, ephemeral=True)
@@ -41,16 +101,10 @@ class StatusCog(commands.Cog):
     async def status(self, interaction: discord.Interaction, ephemeral: bool = False):
         await interaction.response.defer(ephemeral=ephemeral)
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(STATUS_URL) as resp:
-                    data = await resp.json()
-
-            status_val = data.get("status", "")
-            if status_val == "Signed":
-                signed = True
-            elif status_val == "Revoked":
-                signed = False
-            else:
+            snap = await self.snapshots.get()
+
+            signed = snap.signed
+            if signed is None:
                 await self.send_error(
                     interaction,
                     "Sorry, something went wrong while fetching the status. Please try again later."
@@ -64,7 +118,7 @@ class StatusCog(commands.Cog):
                 else "❌ Jailbreaks.app is not signed right now. This means you cannot install apps currently. There is no ETA for when it will be signed."
             )
 
-            embed = discord.Embed(description=message, color=color)
+            embed = discord.Embed(description=f"{message}\n{self.freshness_line(snap)}", color=color)
 
             if STATUS_NOTE:
                 embed.add_field(name="Note:", value=STATUS_NOTE, inline=False)
@@ -72,8 +126,10 @@ class StatusCog(commands.Cog):
             view = discord.ui.View()
             view.add_item(discord.ui.Button(label="Website", url="https://jailbreaks.app"))
             await interaction.followup.send(embed=embed, view=view)
+        except StatusUnavailable:
+            await self.send_error(interaction, STATUS_UNAVAILABLE_MESSAGE)
         except Exception:
-            traceback.print_exc()
+            log.exception("/status failed")
             await self.send_error(interaction, "Sorry, something went wrong while fetching the status. Please try again later.")
 
     @app_commands.command(name="certinfo", description="Check Jailbreaks.app certificate info")
@@ -81,9 +137,8 @@ class StatusCog(commands.Cog):
     async def certinfo(self, interaction: discord.Interaction, ephemeral: bool = False):
         await interaction.response.defer(ephemeral=ephemeral)
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(INFO_URL) as resp:
-                    data = await resp.json()
+            snap = await self.snapshots.get()
+            data = snap.info
 
             status = data.get("status", "Unknown")
             revocation_date = data.get("revocationDate")
@@ -99,6 +154,7 @@ class StatusCog(commands.Cog):
 
             -# Keep in mind that expiry date does not correlate to when it is revoked, and Revocation date is for when it was previously revoked, not a date in the future.
             """).strip().replace("\n\n\n", "\n")  # remove extra newlines if no revocation date
+            description_str += f"\n{self.freshness_line(snap)}"
 
             embed = discord.Embed(description=description_str, color=discord.Color.blue())
 
@@ -106,8 +162,10 @@ class StatusCog(commands.Cog):
                 embed.add_field(name="Note", value=STATUS_NOTE, inline=False)
 
             await interaction.followup.send(embed=embed)
+        except StatusUnavailable:
+            await self.send_error(interaction, STATUS_UNAVAILABLE_MESSAGE)
         except Exception:
-            traceback.print_exc()
+            log.exception("/certinfo failed")
             await self.send_error(interaction, "Sorry, something went wrong while fetching the certificate info.")
 
     async def update_presence(self, signed: bool):
@@ -128,117 +186,271 @@ class StatusCog(commands.Cog):
                 activity=discord.Activity(type=discord.ActivityType.watching, name="❌ Revoked")
             )
 
-    @tasks.loop(minutes=2)
+    @tasks.loop(seconds=POLL_INTERVAL_SECONDS)
     async def check_status(self):
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(STATUS_URL) as resp:
-                    if resp.status != 200:
-                        return
-                    data = await resp.json()
-
-            status_val = data.get("status", "")
-
-            if status_val == "Signed":
-                new_status = "signed"
-                signed = True
-            elif status_val == "Revoked":
-                new_status = "revoked"
-                signed = False
-            else:
+            if self.cluster.is_leader:
+                await self.poll_status()
+        finally:
+            # counted from the start of this poll, see PollSchedule for how it's picked
+            self.check_status.change_interval(seconds=self.schedule.next_interval())
+
+    async def poll_status(self):
+        try:
+            try:
+                snap = await self.snapshots.refresh()
+            except aiohttp.ClientResponseError as e:
+                # non-200 from upstream, try again sooner or later depending on how often this happens
+                POLL_OUTCOMES.inc("http_error")
+                self.schedule.failed()
+                log.warning(f"Status poll got HTTP {e.status} ({self.schedule.failures} failed in a row)")
+                return
+            except CircuitOpenError:
+                # upstream has been failing, the breaker logs its state changes
+                POLL_OUTCOMES.inc("circuit_open")
+                self.schedule.failed()
+                return
+            except Exception:
+                POLL_OUTCOMES.inc("unreachable")
+                self.schedule.failed()
+                log.warning(f"Status poll failed ({self.schedule.failures} in a row)", exc_info=True)
                 return
 
+            signed = snap.signed
+            if signed is None:
+                POLL_OUTCOMES.inc("unknown")
+                self.schedule.failed()
+                return
+            new_status = "signed" if signed else "revoked"
+
             if self.last_status is None:
                 self.last_status = new_status
+                self.outbox.set_last_status(new_status)
+                self._first_poll = False
+                POLL_OUTCOMES.inc("first")
+                self.share_status(snap)
                 await self.update_presence(signed)
                 return
 
-            if new_status != self.last_status:
+            # a different status is only announced once enough polls in a row agree on it
+            observed = self.schedule.observe(new_status, self.last_status)
+            POLL_OUTCOMES.inc(observed)
+            if observed == OBSERVED_CONFIRMED:
+                log.info(f"Status changed from {self.last_status} to {new_status}")
                 self.last_status = new_status
-                await self.announce_status_change(signed)
+                # followers start announcing to their own shards' servers while this one does
+                self.share_status(snap)
                 await self.update_presence(signed)
+                await self.announce_status_change(signed)
+            else:
+                self.share_status(snap)
+                if observed == OBSERVED_PENDING:
+                    log.info(
+                        f"Upstream says {new_status}, announcing after "
+                        f"{self.schedule.confirmations - self.schedule.agreeing} more poll(s) agree"
+                    )
+                elif observed == OBSERVED_FLAP:
+                    log.warning(f"Upstream went back to {new_status} before the change was confirmed, not announcing")
+                if self._first_poll:
+                    # presence isn't kept across restarts even when last_status is
+                    await self.update_presence(self.last_status == "signed")
+            self._first_poll = False
         except Exception:
-            traceback.print_exc()
+            POLL_OUTCOMES.inc("error")
+            log.exception("Status check failed")
+
+    def share_status(self, snap: StatusSnapshot):
+        self.cluster.publish(
+            "status",
+            {"status": snap.status, "info": snap.info, "fetched_at": snap.fetched_at, "committed": self.last_status},
+        )
+
+    async def on_cluster_status(self, data: dict):
+        # a follower: the leader polled, keep /status current and announce what it committed
+        self.snapshots.adopt(data.get("status"), data.get("info"), float(data.get("fetched_at") or 0.0))
+        committed = data.get("committed")
+        if committed not in ("signed", "revoked"):
+            return
+        await self.bot.wait_until_ready()
+        if committed == self.last_status:
+            if self._first_poll:
+                self._first_poll = False
+                await self.update_presence(committed == "signed")
+            return
+        previous, self.last_status = self.last_status, committed
+        self._first_poll = False
+        await self.update_presence(committed == "signed")
+        if previous is None:
+            self.outbox.set_last_status(committed)
+            return
+        log.info(f"Cluster leader committed {committed} (was {previous}), announcing to this process's servers")
+        await self.announce_status_change(committed == "signed")
+
+    def hub_elsewhere(self) -> bool:
+        # in a cluster the hub channel can be on another process's shards; that process publishes it
+        return self.cluster.enabled and bool(ANNOUNCE_HUB_CHANNEL_ID)
+
+    def build_announcement_embed(self, signed: bool, when: Optional[datetime] = None) -> discord.Embed:
+        color = discord.Color.green() if signed else discord.Color.red()
+
+        title = (
+            "Jailbreaks.app is currently signed!"
+            if signed
+            else "Jailbreaks.app is no longer signed."
+        )
+
+        description = (
+            "Apps are signed and can be downloaded now. Hooray!\n\n"
+            if signed
+            else "The apps have been revoked by Apple and cannot currently be installed.\n"
+                 "**We do not know when they will be available again.**"
+        )
+
+        embed = discord.Embed(
+            title=title,
+            description=description,
+            color=color
+        )
+
+        if signed:
+            embed.add_field(
+                name="Download:",
+                value="[Link](https://jailbreaks.app/)",
+                inline=True
+            )
 
-    async def announce_status_change(self, signed: bool):
-        configs = ConfigManager.load_config()
-        for guild_id, cfg in configs.items():
-            if not cfg.get("channel_id"):
-                continue
+            embed.add_field(
+                name="Download (Legacy)",
+                value="[Link](https://jailbreaks.app/legacy.html)",
+                inline=True
+            )
 
-            try:
-                gid_int = int(guild_id)
-            except ValueError:
+        embed.set_footer(
+            text=(when or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        )
+        return embed
+
+    def resolve_announce_targets(
+        self,
+        guild_ids: List[str],
+        stats: FanoutStats,
+        message_ids: Optional[Dict[str, int]] = None,
+        deferred: Optional[List[str]] = None,
+    ) -> List[AnnounceTarget]:
+        """Targets for the guilds that can get the announcement now; guilds in an outage go into `deferred`."""
+        targets: List[AnnounceTarget] = []
+        hub = get_hub_channel(self.bot)
+        for guild_id in guild_ids:
+            if guild_id == HUB_DELIVERY_ID:
+                if hub is None:
+                    stats.skipped += 1
+                else:
+                    message_id = (message_ids or {}).get(HUB_DELIVERY_ID)
+                    targets.append(AnnounceTarget(HUB_DELIVERY_ID, hub, None, publish=True, message_id=message_id))
                 continue
 
-            guild = self.bot.get_guild(gid_int)
-            if not guild:
+            entry = self.targets.get(guild_id)
+            if entry is None:
+                stats.skipped += 1
                 continue
 
-            try:
-                channel_id = int(cfg["channel_id"])
-            except (KeyError, ValueError):
+            guild = self.bot.get_guild(entry.guild_id)
+            if guild is not None and guild.unavailable:
+                # its channels aren't cached during an outage, that doesn't mean they're gone
+                stats.deferred += 1
+                if deferred is not None:
+                    deferred.append(guild_id)
                 continue
-
-            channel = guild.get_channel(channel_id)
+            channel = guild.get_channel(entry.channel_id) if guild else None
             if not channel:
+                # missed the gateway event somehow, don't check this one again
+                self.targets.mark_dead(guild_id, "guild or channel not found")
+                stats.skipped += 1
                 continue
 
-            role = None
-            if cfg.get("ping_role_id"):
-                try:
-                    role = guild.get_role(int(cfg["ping_role_id"]))
-                except ValueError:
-                    pass
+            if entry.follow and (hub is not None or self.hub_elsewhere()):
+                # the embed arrives through the followed hub channel, only ping here
+                if not entry.role_mention:
+                    stats.skipped += 1
+                    continue
+                targets.append(AnnounceTarget(entry.guild_id, channel, entry.role_mention, with_embed=False))
+                continue
 
-            color = discord.Color.green() if signed else discord.Color.red()
+            targets.append(AnnounceTarget(entry.guild_id, channel, entry.role_mention))
+        return targets
 
-            title = (
-                "Jailbreaks.app is currently signed!"
-                if signed
-                else "Jailbreaks.app is no longer signed."
-            )
+    async def announce_status_change(self, signed: bool):
+        # persist the transition and every pending guild before sending anything
+        hub = get_hub_channel(self.bot)
+        guild_ids: List[str] = [HUB_DELIVERY_ID] if hub is not None else []
+        # Discord crossposts the hub message to followers, they only need a direct send for a role ping
+        guild_ids += self.targets.guild_ids(skip_followers=hub is not None or self.hub_elsewhere())
+        self.outbox.record_transition("signed" if signed else "revoked", guild_ids)
+        await self.deliver_pending()
+
+    async def deliver_pending(self):
+        async with self._deliver_lock:
+            for transition in self.outbox.due_transitions():
+                signed = transition.status == "signed"
+                # same embed for every guild, only the role ping differs
+                embed = self.build_announcement_embed(signed, datetime.fromtimestamp(transition.created_at))
+                stats = FanoutStats()
+                deferred: List[str] = []
+                targets = self.resolve_announce_targets(transition.guild_ids, stats, transition.message_ids, deferred)
+                resolved = {str(t.guild_id) for t in targets}
+                for gid in deferred:
+                    self.outbox.record_result(transition.id, gid, RESULT_RETRY)
+                for gid in transition.guild_ids:
+                    if gid not in resolved and gid not in deferred:
+                        self.outbox.mark(transition.id, gid, STATE_SKIPPED)
+                await self.announcer.send(
+                    targets,
+                    embed,
+                    stats,
+                    on_result=lambda t, result, tid=transition.id: self.outbox.record_result(tid, t.guild_id, result, t.message_id),
+                )
+                log.info(f"Announced {transition.status} #{transition.id}: {stats.summary()}")
 
-            description = (
-                "Apps are signed and can be downloaded now. Hooray!\n\n"
-                if signed
-                else "The apps have been revoked by Apple and cannot currently be installed.\n"
-                     "**We do not know when they will be available again.**"
-            )
+    @tasks.loop(seconds=OUTBOX_RETRY_SECONDS)
+    async def retry_deliveries(self):
+        # first run after startup resumes anything a restart interrupted
+        try:
+            await self.deliver_pending()
+        except Exception:
+            log.exception("Retrying pending announcements failed")
 
-            embed = discord.Embed(
-                title=title,
-                description=description,
-                color=color
-            )
-            
-            if signed:
-                embed.add_field(
-                    name="Download:",
-                    value="[Link](https://jailbreaks.app/)",
-                    inline=True
-                )
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.targets.update_guild(str(guild.id), ConfigManager.get_guild(guild.id))
 
-                embed.add_field(
-                    name="Download (Legacy)",
-                    value="[Link](https://jailbreaks.app/legacy.html)",
-                    inline=True
-                )
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        # back from an outage; also revives an entry that was marked dead while it was away
+        self.targets.update_guild(str(guild.id), ConfigManager.get_guild(guild.id))
 
-            embed.set_footer(
-                text=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            )
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.targets.guild_removed(guild.id)
 
-            content = role.mention if role else None
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.targets.channel_deleted(channel.guild.id, channel.id)
 
-            try:
-                await channel.send(content=content, embed=embed)
-            except Exception:
-                traceback.print_exc()
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.targets.role_deleted(role.guild.id, role.id)
 
     @check_status.before_loop
     async def before_check_status(self):
         await self.bot.wait_until_ready()
+        # the guild cache is complete now, drop targets that went away while offline
+        self.targets.prune(self.bot)
+        if self.targets.dead:
+            log.warning(f"{len(self.targets.dead)} configured server(s) can't receive announcements")
+
+    @retry_deliveries.before_loop
+    async def before_retry_deliveries(self):
+        await self.bot.wait_until_ready()
 
 async def setup(bot):
     await bot.add_cog(StatusCog(bot))
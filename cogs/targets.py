@@ -0,0 +1,97 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from .announcer import MODE_FOLLOW
+
+class TargetEntry:
+    __slots__ = ("guild_id", "channel_id", "role_id", "role_mention", "follow")
+
+    def __init__(self, guild_id: int, channel_id: int, role_id: Optional[int], follow: bool):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.role_id = role_id
+        self.role_mention = f"<@&{role_id}>" if role_id else None
+        self.follow = follow
+
+class TargetTable:
+    """
+    Announcement targets parsed once from the guild config.
+    Kept up to date from config saves and gateway events, so announcing only
+    does dict lookups for guilds that can actually receive the message.
+    Entries that stop working are moved to `dead` with a reason instead of being checked every time.
+    """
+
+    def __init__(self, owns: Optional[Callable[[int], bool]] = None):
+        self.entries: Dict[str, TargetEntry] = {}
+        self.dead: Dict[str, str] = {}
+        # guilds on other processes' shards are left to those processes
+        self.owns = owns
+
+    def rebuild(self, configs: Iterable[Tuple[str, Dict[str, str]]]) -> None:
+        self.entries = {}
+        self.dead = {}
+        for gid, cfg in configs:
+            self.update_guild(gid, cfg)
+
+    def update_guild(self, gid: str, cfg: Optional[Dict[str, str]]) -> None:
+        gid = str(gid)
+        self.entries.pop(gid, None)
+        self.dead.pop(gid, None)
+        if not cfg or not cfg.get("channel_id"):
+            return
+        try:
+            guild_id = int(gid)
+            channel_id = int(cfg["channel_id"])
+        except ValueError:
+            self.dead[gid] = "invalid guild or channel id"
+            return
+        if self.owns is not None and not self.owns(guild_id):
+            return
+        role_id = None
+        if cfg.get("ping_role_id"):
+            try:
+                role_id = int(cfg["ping_role_id"])
+            except ValueError:
+                pass
+        self.entries[gid] = TargetEntry(guild_id, channel_id, role_id, cfg.get("delivery_mode") == MODE_FOLLOW)
+
+    def get(self, gid) -> Optional[TargetEntry]:
+        return self.entries.get(str(gid))
+
+    def mark_dead(self, gid, reason: str) -> None:
+        gid = str(gid)
+        if self.entries.pop(gid, None) is not None:
+            self.dead[gid] = reason
+
+    def guild_removed(self, guild_id: int) -> None:
+        self.mark_dead(guild_id, "bot is no longer in this server")
+
+    def channel_deleted(self, guild_id: int, channel_id: int) -> None:
+        entry = self.get(guild_id)
+        if entry is not None and entry.channel_id == channel_id:
+            self.mark_dead(guild_id, "announcement channel was deleted")
+
+    def role_deleted(self, guild_id: int, role_id: int) -> None:
+        entry = self.get(guild_id)
+        if entry is not None and entry.role_id == role_id:
+            # still announce, just without the ping
+            entry.role_id = None
+            entry.role_mention = None
+
+    def prune(self, bot) -> None:
+        """Drops entries whose guild or channel isn't in the cache. Only meaningful once the bot is ready."""
+        for gid, entry in list(self.entries.items()):
+            guild = bot.get_guild(entry.guild_id)
+            if guild is None:
+                self.mark_dead(gid, "bot is no longer in this server")
+            elif guild.unavailable:
+                # outage, its channels aren't cached; on_guild_available rebuilds the entry anyway
+                continue
+            elif guild.get_channel(entry.channel_id) is None:
+                self.mark_dead(gid, "announcement channel was deleted")
+            elif entry.role_id and guild.get_role(entry.role_id) is None:
+                self.role_deleted(entry.guild_id, entry.role_id)
+
+    def guild_ids(self, skip_followers: bool = False) -> List[str]:
+        # followers without a ping role get the hub crosspost and need no direct send
+        if not skip_followers:
+            return list(self.entries)
+        return [gid for gid, e in self.entries.items() if not (e.follow and not e.role_id)]
@@ -0,0 +1,173 @@
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import time
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+import discord
+from .logs import get_logger
+
+log = get_logger("traces")
+
+TRACE_VERSION = 1
+# events are buffered and written in batches, at most this far apart
+TRACE_FLUSH_EVENTS = 200
+TRACE_FLUSH_SECONDS = 5.0
+
+# option types that hold a user/channel/role/attachment, never written to a trace
+PRIVATE_OPTION_TYPES = {
+    discord.AppCommandOptionType.user.value,
+    discord.AppCommandOptionType.channel.value,
+    discord.AppCommandOptionType.role.value,
+    discord.AppCommandOptionType.mentionable.value,
+    discord.AppCommandOptionType.attachment.value,
+}
+GROUP_OPTION_TYPES = {
+    discord.AppCommandOptionType.subcommand.value,
+    discord.AppCommandOptionType.subcommand_group.value,
+}
+
+# event kinds as written to the file
+KIND_COMMAND = "cmd"
+KIND_AUTOCOMPLETE = "ac"
+KIND_COMPONENT = "comp"
+KIND_MODAL = "modal"
+KINDS = {
+    discord.InteractionType.application_command: KIND_COMMAND,
+    discord.InteractionType.autocomplete: KIND_AUTOCOMPLETE,
+    discord.InteractionType.component: KIND_COMPONENT,
+    discord.InteractionType.modal_submit: KIND_MODAL,
+}
+
+def flatten_options(options: List[Dict[str, Any]]) -> Tuple[List[str], Dict[str, Any], Optional[str]]:
+    """
+    Raw interaction options -> (subcommand path, {option: value}, focused option name).
+    Values of user/channel/role/attachment options are replaced with None.
+    """
+    path: List[str] = []
+    values: Dict[str, Any] = {}
+    focused = None
+    while options:
+        if len(options) == 1 and options[0].get("type") in GROUP_OPTION_TYPES:
+            path.append(options[0]["name"])
+            options = options[0].get("options") or []
+            continue
+        for option in options:
+            name = option.get("name")
+            values[name] = None if option.get("type") in PRIVATE_OPTION_TYPES else option.get("value")
+            if option.get("focused"):
+                focused = name
+        break
+    return path, values, focused
+
+class TraceRecorder:
+    """
+    Opt-in recorder of the interactions the bot receives, for bench/replay.py.
+    Each event is one compact JSON line: time since recording started, kind, command (or custom_id),
+    options and a salted hash of the guild. No user ids, message content or modal contents are kept.
+    On when TRACE_FILE is set; a name ending in .gz is written gzipped.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path is not None else os.getenv("TRACE_FILE", "")
+        # per recording, so hashed guild ids can't be matched across traces
+        self._salt = secrets.token_bytes(16)
+        self._file: Optional[IO[str]] = None
+        self._started = 0.0
+        self._buffer: List[str] = []
+        self._last_flush = 0.0
+        self.recorded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start(self) -> None:
+        if not self.enabled or self._file is not None:
+            return
+        opener = gzip.open if self.path.endswith(".gz") else open
+        self._file = opener(self.path, "wt", encoding="utf-8")
+        self._started = self._last_flush = time.monotonic()
+        self._file.write(json.dumps({"v": TRACE_VERSION, "started": int(time.time())}) + "\n")
+        log.info(f"Recording interaction traces to {self.path}")
+
+    def _guild(self, guild_id: Optional[int]) -> Optional[str]:
+        if guild_id is None:
+            return None
+        return hashlib.blake2s(str(guild_id).encode(), key=self._salt, digest_size=4).hexdigest()
+
+    def event(self, interaction: discord.Interaction, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        kind = KINDS.get(interaction.type)
+        if kind is None:
+            return None
+        data = interaction.data or {}
+        now = time.monotonic() if now is None else now
+        event: Dict[str, Any] = {"t": round(now - self._started, 3), "k": kind}
+        if kind in (KIND_COMMAND, KIND_AUTOCOMPLETE):
+            path, values, focused = flatten_options(data.get("options") or [])
+            event["c"] = " ".join([data.get("name", "")] + path)
+            if values:
+                event["o"] = values
+            if focused:
+                event["f"] = focused
+        else:
+            event["c"] = data.get("custom_id", "")
+            if kind == KIND_COMPONENT and data.get("values"):
+                event["o"] = {"values": data["values"]}
+        guild = self._guild(interaction.guild_id)
+        if guild:
+            event["g"] = guild
+        return event
+
+    def record(self, interaction: discord.Interaction) -> None:
+        if self._file is None:
+            return
+        event = self.event(interaction)
+        if event is None:
+            return
+        self._buffer.append(json.dumps(event, separators=(",", ":"), ensure_ascii=False))
+        self.recorded += 1
+        if len(self._buffer) >= TRACE_FLUSH_EVENTS or time.monotonic() - self._last_flush >= TRACE_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is None:
+            return
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        try:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._file.flush()
+        except OSError:
+            log.exception(f"Failed to write traces to {self.path}, recording stopped")
+            self._close_file()
+        self._buffer.clear()
+
+    def _close_file(self) -> None:
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        if self._file is not None:
+            self._close_file()
+            log.info(f"Recorded {self.recorded} interactions to {self.path}")
+
+def read_trace(path: str) -> Iterator[Dict[str, Any]]:
+    """Events from a file written by TraceRecorder, in recorded order (the header line is skipped)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if "k" in event:
+                yield event
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+import aiohttp
+from .logs import get_logger
+from .metrics import REGISTRY, UPSTREAM_BREAKER_TRANSITIONS, UPSTREAM_LATENCY, UPSTREAM_RESPONSES
+from .metrics import UPSTREAM_BYTES_SAVED, UPSTREAM_NOT_MODIFIED, UPSTREAM_PARSE_SECONDS_SAVED
+
+log = get_logger("upstream")
+
+HTTP_TIMEOUT_SECONDS = 10
+HTTP_CONNECT_TIMEOUT_SECONDS = 5
+HTTP_RETRIES = 2
+# connection pool: keep sockets to api.jailbreaks.app / jailbreaks.app open between calls
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 20
+HTTP_KEEPALIVE_SECONDS = 60
+HTTP_DNS_CACHE_SECONDS = 300
+# per-endpoint circuit breaker: failed requests in a row before it opens, and how long it stays open
+# (doubled every time the probe after it fails, up to the max)
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+BREAKER_MAX_RESET_SECONDS = 300.0
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+# jbapp_upstream_breaker_state values
+BREAKER_STATE_VALUES = {BREAKER_CLOSED: 0, BREAKER_HALF_OPEN: 1, BREAKER_OPEN: 2}
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request while an endpoint's breaker is open."""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"{endpoint} is failing, not retrying for {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+def is_upstream_failure(e: BaseException) -> bool:
+    # a 404 or 400 means upstream answered fine; timeouts, connection errors, 5xx and 429 mean it's struggling
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status >= 500 or e.status == 429
+    return True
+
+class CircuitBreaker:
+    """
+    Closed: requests go through. After `threshold` failures in a row it opens and every call fails
+    straight away with CircuitOpenError, so callers fall back to what they have instead of each
+    waiting out timeouts and retries. After `reset` seconds it's half-open: one request is let
+    through as a probe, success closes it, failure opens it again for twice as long.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset: float = BREAKER_RESET_SECONDS,
+        max_reset: float = BREAKER_MAX_RESET_SECONDS,
+    ):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.base_reset = reset
+        self.max_reset = max_reset
+        self.reset = reset
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # when the half-open probe was let through; a probe that never reports back is replaced after a timeout
+        self._probe_started: Optional[float] = None
+
+    def before_request(self) -> None:
+        if self.state == BREAKER_CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == BREAKER_OPEN:
+            remaining = self.opened_at + self.reset - now
+            if remaining > 0:
+                raise CircuitOpenError(self.endpoint, remaining)
+            self._set_state(BREAKER_HALF_OPEN)
+        if self._probe_started is not None and now - self._probe_started < HTTP_TIMEOUT_SECONDS:
+            raise CircuitOpenError(self.endpoint, HTTP_TIMEOUT_SECONDS - (now - self._probe_started))
+        self._probe_started = now
+
+    def record_success(self) -> None:
+        self._probe_started = None
+        self.failures = 0
+        if self.state != BREAKER_CLOSED:
+            self.reset = self.base_reset
+            self._set_state(BREAKER_CLOSED)
+
+    def record_failure(self) -> None:
+        self._probe_started = None
+        self.failures += 1
+        if self.state == BREAKER_HALF_OPEN:
+            self.reset = min(self.max_reset, self.reset * 2)
+            self._open()
+        elif self.state == BREAKER_CLOSED and self.failures >= self.threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.opened_at = time.monotonic()
+        self._set_state(BREAKER_OPEN)
+
+    def _set_state(self, state: str) -> None:
+        previous, self.state = self.state, state
+        UPSTREAM_BREAKER_TRANSITIONS.inc(self.endpoint, state)
+        if state == BREAKER_OPEN:
+            log.warning(
+                f"Circuit for {self.endpoint} {previous} -> open after {self.failures} failure(s), "
+                f"serving cached data for {self.reset:.0f}s"
+            )
+        else:
+            log.info(f"Circuit for {self.endpoint} {previous} -> {state}")
+
+class CachedResponse:
+    __slots__ = ("etag", "last_modified", "data", "size", "parse_time")
+
+    def __init__(self, etag: Optional[str], last_modified: Optional[str], data: Any, size: int, parse_time: float):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.data = data
+        self.size = size
+        self.parse_time = parse_time
+
+class ValidatorCache:
+    """
+    ETag / Last-Modified per URL plus the body already parsed for it,
+    so a 304 hands back the old object without downloading or decoding anything.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, CachedResponse] = {}
+        self.not_modified = 0
+        self.bytes_saved = 0
+        self.parse_seconds_saved = 0.0
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        entry = self.entries.get(url)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def reuse(self, url: str, endpoint: Optional[str] = None) -> Any:
+        entry = self.entries[url]
+        self.not_modified += 1
+        self.bytes_saved += entry.size
+        self.parse_seconds_saved += entry.parse_time
+        endpoint = endpoint or url
+        UPSTREAM_NOT_MODIFIED.inc(endpoint)
+        UPSTREAM_BYTES_SAVED.inc(endpoint, amount=entry.size)
+        UPSTREAM_PARSE_SECONDS_SAVED.inc(endpoint, amount=entry.parse_time)
+        return entry.data
+
+    def store(self, url: str, resp: aiohttp.ClientResponse, data: Any, size: int, parse_time: float) -> None:
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.entries[url] = CachedResponse(etag, last_modified, data, size, parse_time)
+        else:
+            self.entries.pop(url, None)
+
+async def fetch_json_with_retry(
+    session: aiohttp.ClientSession,
+    url: str,
+    validators: Optional[ValidatorCache] = None,
+    endpoint: Optional[str] = None,
+    breaker: Optional[CircuitBreaker] = None,
+) -> Any:
+    data, _ = await fetch_json_body_with_retry(session, url, validators, endpoint, breaker)
+    return data
+
+async def fetch_json_body_with_retry(
+    session: aiohttp.ClientSession,
+    url: str,
+    validators: Optional[ValidatorCache] = None,
+    endpoint: Optional[str] = None,
+    breaker: Optional[CircuitBreaker] = None,
+) -> Tuple[Any, Optional[bytes]]:
+    """(parsed JSON, raw body); the body is None when a 304 handed back the cached data."""
+    # metrics label, callers pass a template for URLs that embed an id
+    endpoint = endpoint or url
+    last_exc: Optional[BaseException] = None
+    for attempt in range(HTTP_RETRIES + 1):
+        if breaker is not None:
+            # raises CircuitOpenError, also between retries once the breaker has opened
+            breaker.before_request()
+        request_started = time.perf_counter()
+        try:
+            headers = validators.request_headers(url) if validators is not None else {}
+            async with session.get(url, headers=headers) as resp:
+                UPSTREAM_RESPONSES.inc(endpoint, resp.status)
+                if resp.status == 304 and validators is not None and url in validators.entries:
+                    UPSTREAM_LATENCY.observe(time.perf_counter() - request_started, endpoint)
+                    if breaker is not None:
+                        breaker.record_success()
+                    return validators.reuse(url, endpoint), None
+                resp.raise_for_status()
+                body = await resp.read()
+                UPSTREAM_LATENCY.observe(time.perf_counter() - request_started, endpoint)
+                started = time.perf_counter()
+                data = json.loads(body)
+                if validators is not None:
+                    validators.store(url, resp, data, len(body), time.perf_counter() - started)
+                if breaker is not None:
+                    breaker.record_success()
+                return data, body
+        except Exception as e:
+            last_exc = e
+            if not isinstance(e, aiohttp.ClientResponseError):
+                UPSTREAM_RESPONSES.inc(endpoint, type(e).__name__)
+            if breaker is not None:
+                if is_upstream_failure(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if attempt < HTTP_RETRIES:
+                await asyncio.sleep(0.4 * (attempt + 1))
+    raise last_exc
+
+class UpstreamClient:
+    """
+    Bot-wide HTTP client for api.jailbreaks.app and jailbreaks.app.
+    One pooled keep-alive session is shared by every cog instead of a new session per call.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.validators = ValidatorCache()
+        # one per endpoint (metrics label), so a failing stats endpoint doesn't cut off /status
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        REGISTRY.collect(
+            "jbapp_upstream_breaker_state",
+            "Upstream circuit breaker state: 0 closed, 1 half-open, 2 open",
+            lambda: {(b.endpoint,): BREAKER_STATE_VALUES[b.state] for b in self.breakers.values()},
+            ("endpoint",),
+        )
+
+    async def start(self) -> None:
+        # must be called from inside the running loop (setup_hook)
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS, sock_connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            raise RuntimeError("UpstreamClient.start() has not been called")
+        return self._session
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+    def circuit_open(self, endpoint: str) -> bool:
+        """Whether calls to this endpoint are currently failing fast (open or half-open)."""
+        breaker = self.breakers.get(endpoint)
+        return breaker is not None and breaker.state != BREAKER_CLOSED
+
+    async def get_json(self, url: str, endpoint: Optional[str] = None) -> Any:
+        endpoint = endpoint or url
+        return await fetch_json_with_retry(self.session, url, self.validators, endpoint, self.breaker(endpoint))
+
+    async def get_json_body(self, url: str, endpoint: Optional[str] = None) -> Tuple[Any, Optional[bytes]]:
+        """Like get_json, but also hands back the body as received, for callers that store it as is."""
+        endpoint = endpoint or url
+        return await fetch_json_body_with_retry(self.session, url, self.validators, endpoint, self.breaker(endpoint))
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None